@@ -1,47 +1,139 @@
 import httpx
 import asyncio
+import os
+import random
 import uuid
+from collections import defaultdict
 from datetime import datetime
+from typing import Optional
 from logger import logger
 
 GA_MEASUREMENT_ID = "G-9S6CF8ERY0"
 GA_API_SECRET = None
+GA_ENDPOINT = os.getenv("GA_ENDPOINT", "https://www.google-analytics.com/mp/collect")
+
+GA_MAX_EVENTS_PER_REQUEST = 25
+ANALYTICS_QUEUE_SIZE = int(os.getenv("ANALYTICS_QUEUE_SIZE", "1000"))
+ANALYTICS_FLUSH_INTERVAL_SECONDS = float(os.getenv("ANALYTICS_FLUSH_INTERVAL_SECONDS", "2.0"))
+ANALYTICS_SAMPLE_RATE = float(os.getenv("ANALYTICS_SAMPLE_RATE", "1.0"))
+ANALYTICS_DROP_POLICY = os.getenv("ANALYTICS_DROP_POLICY", "drop_newest")
+DROP_POLICIES = ("drop_newest", "drop_oldest")
 
 class GoogleAnalytics:
+    # Events go onto a bounded queue and a single worker sends them in
+    # multi-event payloads, so a burst costs at most one request in flight
     def __init__(self):
+        if ANALYTICS_DROP_POLICY not in DROP_POLICIES:
+            raise ValueError(f"Unknown analytics drop policy: {ANALYTICS_DROP_POLICY}")
+
         self.client = httpx.AsyncClient(timeout=5.0)
         self.measurement_id = GA_MEASUREMENT_ID
         self.api_secret = GA_API_SECRET
+        self.endpoint = GA_ENDPOINT
+        self.sample_rate = ANALYTICS_SAMPLE_RATE
+        self.drop_policy = ANALYTICS_DROP_POLICY
+        self.flush_interval = ANALYTICS_FLUSH_INTERVAL_SECONDS
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=ANALYTICS_QUEUE_SIZE)
+        self._worker: Optional[asyncio.Task] = None
+        self.counters = {
+            "enqueued": 0,
+            "sampled_out": 0,
+            "dropped": 0,
+            "sent_events": 0,
+            "sent_batches": 0,
+            "failed_batches": 0,
+        }
+
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+
+    def track_event(self, event_name: str, params: dict, client_id: str = None):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self.counters["sampled_out"] += 1
+            return
 
-    async def track_event(self, event_name: str, params: dict, client_id: str = None):
         if not client_id:
             client_id = str(uuid.uuid4())
 
-        payload = {
-            "client_id": client_id,
-            "events": [{
-                "name": event_name,
-                "params": {
-                    **params,
-                    "engagement_time_msec": "100"
-                }
-            }]
-        }
+        event = (client_id, {
+            "name": event_name,
+            "params": {
+                **params,
+                "engagement_time_msec": "100"
+            }
+        })
+
+        if self.queue.full():
+            self.counters["dropped"] += 1
+            if self.drop_policy == "drop_newest":
+                return
+            self.queue.get_nowait()
+
+        self.queue.put_nowait(event)
+        self.counters["enqueued"] += 1
 
-        url = f"https://www.google-analytics.com/mp/collect?measurement_id={self.measurement_id}"
+    def _drain(self, first_event) -> list:
+        events = [first_event]
+        while not self.queue.empty():
+            events.append(self.queue.get_nowait())
+        return events
+
+    async def _run(self):
+        while True:
+            first_event = await self.queue.get()
+            # Give a burst a moment to accumulate before sending
+            await asyncio.sleep(self.flush_interval)
+            await self._send(self._drain(first_event))
+
+    async def _send(self, events: list):
+        by_client = defaultdict(list)
+        for client_id, event in events:
+            by_client[client_id].append(event)
+
+        url = f"{self.endpoint}?measurement_id={self.measurement_id}"
         if self.api_secret:
             url += f"&api_secret={self.api_secret}"
 
-        try:
-            response = await self.client.post(url, json=payload)
-            if response.status_code == 204:
-                logger.debug(f"GA4 event tracked: {event_name}")
-            else:
-                logger.warning(f"GA4 tracking failed: {response.status_code} - {response.text}")
-        except Exception as e:
-            logger.error(f"GA4 tracking error: {str(e)}")
+        for client_id, client_events in by_client.items():
+            for start in range(0, len(client_events), GA_MAX_EVENTS_PER_REQUEST):
+                batch = client_events[start:start + GA_MAX_EVENTS_PER_REQUEST]
+                payload = {"client_id": client_id, "events": batch}
+
+                try:
+                    response = await self.client.post(url, json=payload)
+                    if response.status_code in (200, 204):
+                        self.counters["sent_events"] += len(batch)
+                        self.counters["sent_batches"] += 1
+                        logger.debug("GA4 batch tracked: %d events", len(batch))
+                    else:
+                        self.counters["failed_batches"] += 1
+                        logger.warning(f"GA4 tracking failed: {response.status_code} - {response.text}")
+                except Exception as e:
+                    self.counters["failed_batches"] += 1
+                    logger.error(f"GA4 tracking error: {str(e)}")
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "sample_rate": self.sample_rate,
+            "drop_policy": self.drop_policy,
+        }
 
     async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+        if not self.queue.empty():
+            await self._send(self._drain(self.queue.get_nowait()))
+
         await self.client.aclose()
 
 analytics = GoogleAnalytics()
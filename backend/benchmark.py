@@ -0,0 +1,196 @@
+import asyncio
+import math
+import os
+import statistics
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List
+from database import save_benchmark_run
+from isolation import ENGINE_CPUSETS, QUERY_ISOLATION_COOLDOWN_MS
+from logger import logger
+from process_lock import FileLock, SHARED_STATE
+
+BENCHMARK_MAX_WARMUP = int(os.getenv("BENCHMARK_MAX_WARMUP", "5"))
+BENCHMARK_MAX_ITERATIONS = int(os.getenv("BENCHMARK_MAX_ITERATIONS", "30"))
+BENCHMARK_MAX_SECONDS = float(os.getenv("BENCHMARK_MAX_SECONDS", "300"))
+BENCHMARK_SCALE_FACTOR = os.getenv("BENCHMARK_SCALE_FACTOR")
+
+ENGINES = ("postgres", "pgx-lower")
+
+
+class BenchmarkBusyError(RuntimeError):
+    pass
+
+
+class BenchmarkBudgetError(RuntimeError):
+    pass
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = math.floor(position)
+    upper = math.ceil(position)
+    if lower == upper:
+        return ordered[lower]
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    mean = statistics.fmean(latencies)
+    stdev = statistics.stdev(latencies) if len(latencies) > 1 else 0.0
+    return {
+        "min": round(min(latencies), 3),
+        "p50": round(percentile(latencies, 0.5), 3),
+        "p95": round(percentile(latencies, 0.95), 3),
+        "mean": round(mean, 3),
+        "stdev": round(stdev, 3),
+        "cv": round(stdev / mean, 4) if mean else None,
+    }
+
+
+# Runs one query repeatedly on both engines. Engines alternate which goes first
+# each iteration so slow drift (caches, thermal) affects both equally. Each
+# execution takes the engine's normal lock, so interactive queries are
+# interleaved between iterations instead of waiting for the whole run, and only
+# one benchmark runs at a time across all workers.
+class BenchmarkRunner:
+    def __init__(
+        self,
+        run_postgres: Callable[[str], Awaitable[Dict[str, Any]]],
+        run_pgx_lower: Callable[[str], Awaitable[Dict[str, Any]]]
+    ):
+        self.engines = {"postgres": run_postgres, "pgx-lower": run_pgx_lower}
+        self.busy = False
+        self.lock = FileLock("benchmark") if SHARED_STATE else None
+
+    def _admit(self) -> None:
+        if self.busy or (self.lock is not None and not self.lock.try_acquire()):
+            raise BenchmarkBusyError("Another benchmark is already running")
+        self.busy = True
+
+    def _release(self) -> None:
+        self.busy = False
+        if self.lock is not None:
+            self.lock.release()
+
+    async def run(
+        self,
+        query: str,
+        query_name: str,
+        warmup: int,
+        iterations: int,
+        label: str
+    ) -> Dict[str, Any]:
+        self._admit()
+        try:
+            return await self._run(query, query_name, warmup, iterations, label)
+        finally:
+            self._release()
+
+    async def _run(
+        self,
+        query: str,
+        query_name: str,
+        warmup: int,
+        iterations: int,
+        label: str
+    ) -> Dict[str, Any]:
+        run_id = uuid.uuid4().hex
+        # Benchmarks always run one engine at a time, whatever the /query mode
+        isolation = {"mode": "interleaved", "cooldown_ms": QUERY_ISOLATION_COOLDOWN_MS}
+        cpusets = {engine: cpuset for engine, cpuset in ENGINE_CPUSETS.items() if cpuset}
+        if cpusets:
+            isolation["cpusets"] = cpusets
+        deadline = time.monotonic() + BENCHMARK_MAX_SECONDS
+        latencies: Dict[str, List[float]] = {engine: [] for engine in ENGINES}
+        rows = []
+        completed = 0
+        truncated = False
+
+        logger.info("Benchmark %s: %s, %s warmup + %s iterations", run_id, query_name, warmup, iterations)
+
+        for iteration in range(-warmup, iterations):
+            if time.monotonic() > deadline:
+                truncated = True
+                break
+
+            order = ENGINES if iteration % 2 == 0 else ENGINES[::-1]
+            for position, engine in enumerate(order):
+                if position and QUERY_ISOLATION_COOLDOWN_MS:
+                    await asyncio.sleep(QUERY_ISOLATION_COOLDOWN_MS / 1000)
+
+                measurement = await self.engines[engine](query)
+                if iteration < 0:
+                    continue
+
+                latencies[engine].append(measurement["latency_ms"])
+                rows.append({
+                    "query_name": query_name,
+                    "iteration": iteration,
+                    "pgx_enabled": 1 if engine == "pgx-lower" else 0,
+                    "execution_metadata": {
+                        "duration_ms": measurement["latency_ms"],
+                        "row_count": measurement.get("row_count"),
+                        "order": position,
+                    },
+                    "metrics": {"memory_peak_mb": None},
+                })
+
+            if iteration >= 0:
+                completed += 1
+
+        # Over budget, the iterations measured so far are kept; the budget is
+        # checked between iterations, so both engines have the same count
+        if truncated:
+            if not completed:
+                raise BenchmarkBudgetError(
+                    f"Benchmark exceeded {BENCHMARK_MAX_SECONDS:.0f}s budget before any measured iteration; "
+                    "use fewer warmup runs"
+                )
+            logger.warning(
+                "Benchmark %s hit the %.0fs budget after "
+                "%s of %s iterations",
+                run_id, BENCHMARK_MAX_SECONDS, completed, iterations
+            )
+
+        summary = {engine: summarize(values) for engine, values in latencies.items()}
+        speedup = None
+        if summary["pgx-lower"]["p50"]:
+            speedup = round(summary["postgres"]["p50"] / summary["pgx-lower"]["p50"], 3)
+
+        scale_factor = float(BENCHMARK_SCALE_FACTOR) if BENCHMARK_SCALE_FACTOR else None
+        await save_benchmark_run(
+            {
+                "run_id": run_id,
+                "label": label,
+                "scale_factor": scale_factor,
+                "iterations": completed,
+                "warmup": warmup,
+                "metadata": {
+                    "query_name": query_name,
+                    "query": query,
+                    "isolation": isolation,
+                    "requested_iterations": iterations,
+                    "truncated": truncated,
+                },
+            },
+            rows
+        )
+
+        logger.info("Benchmark %s finished: pgx-lower speedup %s", run_id, speedup)
+
+        return {
+            "run_id": run_id,
+            "label": label,
+            "query_name": query_name,
+            "warmup": warmup,
+            "iterations": completed,
+            "requested_iterations": iterations,
+            "truncated": truncated,
+            "latencies_ms": latencies,
+            "summary": summary,
+            "isolation": isolation,
+            # PostgreSQL p50 over pgx-lower p50; above 1 means pgx-lower is faster
+            "speedup": speedup,
+        }
@@ -4,12 +4,35 @@ import json
 from pathlib import Path
 import os
 import hashlib
+import math
+import time
+from query_fingerprint import fingerprint_query
 
 DB_PATH = Path(os.getenv("DATABASE_PATH", Path(__file__).parent / "database" / "pgx_lower.db"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "1000"))
+# Separate file in the runs/queries layout read by graphs/make_graphs.py, so it
+# can be copied to graphs/data/benchmark.db as is
+BENCHMARK_DB_PATH = Path(os.getenv("BENCHMARK_DATABASE_PATH", DB_PATH.parent / "benchmark.db"))
 VERSION = "0.1.0"
 
+def as_text(value) -> str:
+    # orjson encodes to bytes; stored as-is they would become BLOBs in TEXT columns
+    return value.decode() if isinstance(value, bytes) else value
+
+async def add_missing_columns(db, table: str, columns: dict):
+    # CREATE TABLE IF NOT EXISTS leaves older databases on the old schema
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        existing = {row[1] for row in await cursor.fetchall()}
+
+    for name, column_type in columns.items():
+        if name not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+
 async def init_db():
     async with aiosqlite.connect(DB_PATH) as db:
+        # WAL lets worker processes read while another one writes
+        await db.execute("PRAGMA journal_mode=WAL")
+
         await db.execute("""
             CREATE TABLE IF NOT EXISTS user_requests (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -35,9 +58,23 @@ async def init_db():
                 query_text TEXT NOT NULL,
                 database TEXT NOT NULL,
                 latency_ms REAL NOT NULL,
+                compile_ms REAL,
+                jit_codegen_ms REAL,
+                execute_ms REAL,
+                warm_latency_ms REAL,
+                phases_json TEXT,
+                isolation_mode TEXT,
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        await add_missing_columns(db, "query_log", {
+            "compile_ms": "REAL",
+            "jit_codegen_ms": "REAL",
+            "execute_ms": "REAL",
+            "warm_latency_ms": "REAL",
+            "phases_json": "TEXT",
+            "isolation_mode": "TEXT",
+        })
 
         await db.execute("""
             CREATE INDEX IF NOT EXISTS idx_query_log_timestamp
@@ -69,6 +106,173 @@ async def init_db():
             )
         """)
 
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS ir_cache (
+                fingerprint TEXT NOT NULL,
+                build_id TEXT NOT NULL,
+                ir_json TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (fingerprint, build_id)
+            )
+        """)
+
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS plan_cache (
+                fingerprint TEXT NOT NULL,
+                database TEXT NOT NULL,
+                plan_json TEXT NOT NULL,
+                metrics_json TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (fingerprint, database)
+            )
+        """)
+
+        # Running per-fingerprint aggregates, one row per engine; mean and
+        # sum_var_ms are updated with Welford's method so stddev needs no history
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS query_stats (
+                fingerprint TEXT NOT NULL,
+                database TEXT NOT NULL,
+                calls INTEGER NOT NULL DEFAULT 0,
+                total_ms REAL NOT NULL DEFAULT 0,
+                min_ms REAL,
+                max_ms REAL,
+                mean_ms REAL NOT NULL DEFAULT 0,
+                sum_var_ms REAL NOT NULL DEFAULT 0,
+                cache_hits INTEGER NOT NULL DEFAULT 0,
+                errors INTEGER NOT NULL DEFAULT 0,
+                rows INTEGER NOT NULL DEFAULT 0,
+                last_seen REAL NOT NULL,
+                PRIMARY KEY (fingerprint, database)
+            )
+        """)
+
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS query_fingerprints (
+                fingerprint TEXT PRIMARY KEY,
+                query_text TEXT NOT NULL,
+                calls INTEGER NOT NULL DEFAULT 0,
+                total_ms REAL NOT NULL DEFAULT 0,
+                speedup REAL,
+                last_seen REAL NOT NULL
+            )
+        """)
+
+        for column in ("total_ms", "calls", "speedup"):
+            await db.execute(f"""
+                CREATE INDEX IF NOT EXISTS idx_query_fingerprints_{column}
+                ON query_fingerprints({column})
+            """)
+
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS slow_queries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fingerprint TEXT NOT NULL,
+                query_text TEXT NOT NULL,
+                database TEXT NOT NULL,
+                elapsed_ms REAL NOT NULL,
+                latency_ms REAL,
+                row_count INTEGER,
+                error TEXT,
+                timings_json TEXT,
+                breakdown_json TEXT,
+                plan_json TEXT,
+                ir_stage_sizes_json TEXT,
+                load_json TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                window_start REAL NOT NULL,
+                previous INTEGER NOT NULL,
+                current INTEGER NOT NULL,
+                last_seen REAL NOT NULL
+            )
+        """)
+
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_rate_limits_last_seen
+            ON rate_limits(last_seen)
+        """)
+
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS inflight_queries (
+                request_id TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+        # Rows written as orjson bytes before values were decoded on insert
+        for table, column in (
+            ("queries", "output_json"),
+            ("ir_cache", "ir_json"),
+            ("plan_cache", "plan_json"),
+            ("plan_cache", "metrics_json"),
+        ):
+            await db.execute(
+                f"UPDATE {table} SET {column} = CAST({column} AS TEXT) WHERE typeof({column}) = 'blob'"
+            )
+
+        await db.commit()
+
+async def init_benchmark_db():
+    async with aiosqlite.connect(BENCHMARK_DB_PATH) as db:
+        await db.execute("PRAGMA journal_mode=WAL")
+
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                label TEXT NOT NULL,
+                scale_factor REAL,
+                iterations INTEGER NOT NULL,
+                warmup INTEGER NOT NULL,
+                version TEXT NOT NULL,
+                metadata_json TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS queries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT NOT NULL,
+                query_name TEXT NOT NULL,
+                iteration INTEGER NOT NULL,
+                pgx_enabled INTEGER NOT NULL,
+                execution_metadata TEXT NOT NULL,
+                metrics_json TEXT NOT NULL,
+                FOREIGN KEY (run_id) REFERENCES runs (run_id)
+            )
+        """)
+
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_benchmark_queries_run
+            ON queries(run_id, query_name, iteration)
+        """)
+
+        await db.commit()
+
+async def save_benchmark_run(run: dict, rows: list):
+    async with aiosqlite.connect(BENCHMARK_DB_PATH) as db:
+        await db.execute(
+            "INSERT INTO runs (run_id, label, scale_factor, iterations, warmup, version, metadata_json) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (run["run_id"], run["label"], run["scale_factor"], run["iterations"], run["warmup"],
+             VERSION, json.dumps(run["metadata"]))
+        )
+        await db.executemany(
+            "INSERT INTO queries (run_id, query_name, iteration, pgx_enabled, execution_metadata, metrics_json) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (run["run_id"], row["query_name"], row["iteration"], row["pgx_enabled"],
+                 json.dumps(row["execution_metadata"]), json.dumps(row["metrics"]))
+                for row in rows
+            ]
+        )
         await db.commit()
 
 async def log_user_request(ip_address: str, request_id: str):
@@ -79,7 +283,7 @@ async def log_user_request(ip_address: str, request_id: str):
         )
         await db.commit()
 
-async def get_cached_query(request_id: str):
+async def get_cached_query_raw(request_id: str):
     async with aiosqlite.connect(DB_PATH) as db:
         async with db.execute(
             "SELECT output_json FROM queries WHERE request_id = ?",
@@ -87,27 +291,336 @@ async def get_cached_query(request_id: str):
         ) as cursor:
             row = await cursor.fetchone()
             if row:
-                return json.loads(row[0])
+                return row[0]
     return None
 
-async def cache_query(request_id: str, input_json: str, output_json: str):
+async def get_cached_request_ids(request_ids):
+    if not request_ids:
+        return set()
+
+    placeholders = ", ".join("?" for _ in request_ids)
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(
+            f"SELECT request_id FROM queries WHERE request_id IN ({placeholders})",
+            list(request_ids)
+        ) as cursor:
+            return {row[0] for row in await cursor.fetchall()}
+
+async def cache_query(request_id: str, input_json: str, output_json):
     async with aiosqlite.connect(DB_PATH) as db:
         await db.execute(
             "INSERT OR REPLACE INTO queries (request_id, input_json, output_json) VALUES (?, ?, ?)",
-            (request_id, input_json, output_json)
+            (request_id, input_json, as_text(output_json))
         )
         await db.commit()
 
-async def log_query_execution(query: str, database: str, latency_ms: float):
+async def get_cached_ir(fingerprint: str, build_id: str):
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(
+            "SELECT ir_json FROM ir_cache WHERE fingerprint = ? AND build_id = ?",
+            (fingerprint, build_id)
+        ) as cursor:
+            row = await cursor.fetchone()
+            if row:
+                return json.loads(row[0])
+    return None
+
+async def cache_ir(fingerprint: str, build_id: str, ir_json: str):
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute(
+            "INSERT OR REPLACE INTO ir_cache (fingerprint, build_id, ir_json) VALUES (?, ?, ?)",
+            (fingerprint, build_id, as_text(ir_json))
+        )
+        await db.commit()
+
+async def prune_ir_cache(build_id: str) -> int:
+    # IR from any other pgx-lower build can never be served again
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute("DELETE FROM ir_cache WHERE build_id != ?", (build_id,))
+        await db.commit()
+        return cursor.rowcount
+
+async def get_cached_plan(fingerprint: str, database: str):
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(
+            "SELECT plan_json FROM plan_cache WHERE fingerprint = ? AND database = ?",
+            (fingerprint, database)
+        ) as cursor:
+            row = await cursor.fetchone()
+            if row:
+                return json.loads(row[0])
+    return None
+
+async def get_cached_plans(fingerprint: str):
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(
+            "SELECT database, plan_json, metrics_json, created_at FROM plan_cache WHERE fingerprint = ?",
+            (fingerprint,)
+        ) as cursor:
+            return [
+                {
+                    "database": row[0],
+                    "plan": json.loads(row[1]),
+                    "metrics": json.loads(row[2]),
+                    "captured_at": row[3],
+                }
+                for row in await cursor.fetchall()
+            ]
+
+async def cache_plan(fingerprint: str, database: str, plan_json: str, metrics_json: str):
+    # Latest plan wins: plans change with statistics, and a fresh EXPLAIN
+    # ANALYZE is the better record
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute(
+            "INSERT OR REPLACE INTO plan_cache (fingerprint, database, plan_json, metrics_json, created_at) "
+            "VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)",
+            (fingerprint, database, as_text(plan_json), as_text(metrics_json))
+        )
+        await db.commit()
+
+async def claim_inflight_query(request_id: str, owner: str, ttl_seconds: float) -> bool:
+    now = time.time()
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute("BEGIN IMMEDIATE")
+        # A claim past its expiry belongs to a worker that died mid-query
+        await db.execute(
+            "DELETE FROM inflight_queries WHERE request_id = ? AND expires_at <= ?",
+            (request_id, now)
+        )
+        cursor = await db.execute(
+            "INSERT OR IGNORE INTO inflight_queries (request_id, owner, expires_at) VALUES (?, ?, ?)",
+            (request_id, owner, now + ttl_seconds)
+        )
+        claimed = cursor.rowcount == 1
+        await db.commit()
+    return claimed
+
+async def is_query_inflight(request_id: str) -> bool:
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(
+            "SELECT 1 FROM inflight_queries WHERE request_id = ? AND expires_at > ?",
+            (request_id, time.time())
+        ) as cursor:
+            return await cursor.fetchone() is not None
+
+async def release_inflight_query(request_id: str, owner: str):
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute(
+            "DELETE FROM inflight_queries WHERE request_id = ? AND owner = ?",
+            (request_id, owner)
+        )
+        await db.commit()
+
+async def log_query_execution(
+    query: str,
+    database: str,
+    latency_ms: float,
+    breakdown: dict = None,
+    isolation_mode: str = None
+):
     query_hash = hashlib.sha256(query.strip().encode()).hexdigest()
+    breakdown = breakdown or {}
+    phases = breakdown.get("phases_ms")
 
     async with aiosqlite.connect(DB_PATH) as db:
         await db.execute(
-            "INSERT INTO query_log (query_hash, query_text, database, latency_ms) VALUES (?, ?, ?, ?)",
-            (query_hash, query, database, latency_ms)
+            "INSERT INTO query_log "
+            "(query_hash, query_text, database, latency_ms, compile_ms, jit_codegen_ms, execute_ms, warm_latency_ms, "
+            "phases_json, isolation_mode) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (query_hash, query, database, latency_ms, breakdown.get("compile_ms"), breakdown.get("jit_codegen_ms"),
+             breakdown.get("execute_ms"), breakdown.get("warm_ms"), json.dumps(phases) if phases else None,
+             isolation_mode)
+        )
+        await db.commit()
+
+async def record_query_stats(query: str, outcomes: dict = None, cache_hit: bool = False):
+    # outcomes maps engine -> {"latency_ms", "rows"} for a successful run, or
+    # None when it failed; a cache hit counts for both engines without timings
+    fingerprint = fingerprint_query(query)
+    now = time.time()
+    outcomes = outcomes or {}
+    engines = ("postgres", "pgx-lower") if cache_hit else tuple(outcomes)
+
+    async with aiosqlite.connect(DB_PATH) as db:
+        for database in engines:
+            outcome = outcomes.get(database)
+            if cache_hit or outcome is None:
+                column = "cache_hits" if cache_hit else "errors"
+                await db.execute(
+                    f"INSERT INTO query_stats (fingerprint, database, {column}, last_seen) VALUES (?, ?, 1, ?) "
+                    f"ON CONFLICT (fingerprint, database) DO UPDATE SET "
+                    f"{column} = {column} + 1, last_seen = excluded.last_seen",
+                    (fingerprint, database, now)
+                )
+                continue
+
+            latency_ms = outcome["latency_ms"]
+            # SET expressions all see the old row, so mean_ms below is the
+            # previous mean and (calls + 1) the new count
+            await db.execute("""
+                INSERT INTO query_stats
+                (fingerprint, database, calls, total_ms, min_ms, max_ms, mean_ms, rows, last_seen)
+                VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (fingerprint, database) DO UPDATE SET
+                    calls = calls + 1,
+                    total_ms = total_ms + excluded.total_ms,
+                    min_ms = MIN(COALESCE(min_ms, excluded.min_ms), excluded.min_ms),
+                    max_ms = MAX(COALESCE(max_ms, excluded.max_ms), excluded.max_ms),
+                    mean_ms = mean_ms + (excluded.mean_ms - mean_ms) / (calls + 1),
+                    sum_var_ms = sum_var_ms + (excluded.mean_ms - mean_ms)
+                        * (excluded.mean_ms - (mean_ms + (excluded.mean_ms - mean_ms) / (calls + 1))),
+                    rows = rows + excluded.rows,
+                    last_seen = excluded.last_seen
+            """, (fingerprint, database, latency_ms, latency_ms, latency_ms, latency_ms, outcome.get("rows") or 0, now))
+
+        total_ms = sum(outcome["latency_ms"] for outcome in outcomes.values() if outcome is not None)
+        await db.execute("""
+            INSERT INTO query_fingerprints (fingerprint, query_text, calls, total_ms, last_seen)
+            VALUES (?, ?, 1, ?, ?)
+            ON CONFLICT (fingerprint) DO UPDATE SET
+                calls = calls + 1,
+                total_ms = total_ms + excluded.total_ms,
+                last_seen = excluded.last_seen
+        """, (fingerprint, query, total_ms, now))
+
+        if not cache_hit:
+            # PostgreSQL mean over pgx-lower mean; below 1 means pgx-lower is slower
+            await db.execute("""
+                UPDATE query_fingerprints SET speedup = (
+                    SELECT pg.mean_ms / px.mean_ms
+                    FROM query_stats pg, query_stats px
+                    WHERE pg.fingerprint = ?1 AND pg.database = 'postgres' AND pg.calls > 0
+                      AND px.fingerprint = ?1 AND px.database = 'pgx-lower' AND px.calls > 0
+                      AND px.mean_ms > 0
+                )
+                WHERE fingerprint = ?1
+            """, (fingerprint,))
+
+        await db.commit()
+
+QUERY_STATS_ORDERS = {
+    "total_time": ("", "total_ms DESC"),
+    "calls": ("", "calls DESC"),
+    # Worst pgx-lower speedup first; fingerprints not yet run on both engines have none
+    "regression": ("WHERE speedup IS NOT NULL", "speedup ASC"),
+}
+
+async def get_query_stats(order: str = "total_time", limit: int = 20):
+    where, order_by = QUERY_STATS_ORDERS[order]
+
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(f"""
+            SELECT fingerprint, query_text, calls, total_ms, speedup, last_seen
+            FROM query_fingerprints
+            {where}
+            ORDER BY {order_by}
+            LIMIT ?
+        """, (limit,)) as cursor:
+            queries = [
+                {
+                    "fingerprint": row[0],
+                    "query": row[1],
+                    "calls": row[2],
+                    "total_ms": round(row[3], 3),
+                    "speedup": round(row[4], 3) if row[4] is not None else None,
+                    "last_seen": row[5],
+                    "engines": {},
+                }
+                for row in await cursor.fetchall()
+            ]
+
+        if not queries:
+            return []
+
+        by_fingerprint = {query["fingerprint"]: query for query in queries}
+        placeholders = ", ".join("?" for _ in by_fingerprint)
+        async with db.execute(f"""
+            SELECT fingerprint, database, calls, total_ms, min_ms, max_ms, mean_ms, sum_var_ms,
+                   cache_hits, errors, rows, last_seen
+            FROM query_stats
+            WHERE fingerprint IN ({placeholders})
+        """, tuple(by_fingerprint)) as cursor:
+            for row in await cursor.fetchall():
+                calls = row[2]
+                by_fingerprint[row[0]]["engines"][row[1]] = {
+                    "calls": calls,
+                    "total_ms": round(row[3], 3),
+                    "min_ms": row[4],
+                    "max_ms": row[5],
+                    "mean_ms": round(row[6], 3) if calls else None,
+                    "stddev_ms": round(math.sqrt(row[7] / calls), 3) if calls else None,
+                    "cache_hits": row[8],
+                    "errors": row[9],
+                    "rows": row[10],
+                    "last_seen": row[11],
+                }
+
+        return queries
+
+SLOW_QUERY_JSON_COLUMNS = ("timings", "breakdown", "plan", "ir_stage_sizes", "load")
+
+async def log_slow_query(record: dict):
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute(
+            "INSERT INTO slow_queries "
+            "(fingerprint, query_text, database, elapsed_ms, latency_ms, row_count, error, "
+            "timings_json, breakdown_json, plan_json, ir_stage_sizes_json, load_json) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (record["fingerprint"], record["query_text"], record["database"], record["elapsed_ms"],
+             record.get("latency_ms"), record.get("row_count"), record.get("error"),
+             *(json.dumps(record[column]) if record.get(column) is not None else None
+               for column in SLOW_QUERY_JSON_COLUMNS))
         )
+        # Ring buffer: ids only grow, so everything more than SLOW_QUERY_LOG_SIZE
+        # behind the newest row is dropped through the primary key
+        await db.execute("DELETE FROM slow_queries WHERE id <= ?", (cursor.lastrowid - SLOW_QUERY_LOG_SIZE,))
         await db.commit()
 
+def slow_query_from_row(row, details: bool) -> dict:
+    record = {
+        "id": row[0],
+        "fingerprint": row[1],
+        "query": row[2],
+        "database": row[3],
+        "elapsed_ms": row[4],
+        "latency_ms": row[5],
+        "row_count": row[6],
+        "error": row[7],
+        "created_at": row[8],
+    }
+    columns = SLOW_QUERY_JSON_COLUMNS if details else ("timings", "load")
+    for column, value in zip(SLOW_QUERY_JSON_COLUMNS, row[9:]):
+        if column in columns:
+            record[column] = json.loads(value) if value is not None else None
+    return record
+
+async def get_slow_queries(limit: int = 50, database: str = None, details: bool = False):
+    # Newest first; plans and breakdowns only when details are asked for
+    where = "WHERE database = ?" if database else ""
+    params = (database, limit) if database else (limit,)
+
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute(f"""
+            SELECT id, fingerprint, query_text, database, elapsed_ms, latency_ms, row_count, error, created_at,
+                   timings_json, breakdown_json, plan_json, ir_stage_sizes_json, load_json
+            FROM slow_queries
+            {where}
+            ORDER BY id DESC
+            LIMIT ?
+        """, params) as cursor:
+            return [slow_query_from_row(row, details) for row in await cursor.fetchall()]
+
+async def get_slow_query(slow_query_id: int):
+    async with aiosqlite.connect(DB_PATH) as db:
+        async with db.execute("""
+            SELECT id, fingerprint, query_text, database, elapsed_ms, latency_ms, row_count, error, created_at,
+                   timings_json, breakdown_json, plan_json, ir_stage_sizes_json, load_json
+            FROM slow_queries
+            WHERE id = ?
+        """, (slow_query_id,)) as cursor:
+            row = await cursor.fetchone()
+            return slow_query_from_row(row, details=True) if row else None
+
 async def compute_hourly_stats():
     from logger import logger
 
@@ -1,3 +1,5 @@
 from .base import DatabaseConnector, QueryResult, QueryOutput, QueryLock
+from .resilience import CircuitBreaker, CircuitOpenError, QueryTimeoutError
 
-__all__ = ['DatabaseConnector', 'QueryResult', 'QueryOutput', 'QueryLock']
+__all__ = ['DatabaseConnector', 'QueryResult', 'QueryOutput', 'QueryLock',
+           'CircuitBreaker', 'CircuitOpenError', 'QueryTimeoutError']
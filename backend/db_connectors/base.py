@@ -1,15 +1,41 @@
 import asyncio
+import time
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
-from typing import Optional, List
+from typing import Any, Dict, Optional, List, Tuple
+import os
 import re
 from datetime import datetime
+from database import cache_plan, get_cached_plan
+from plan_analysis import load_explain, parse_plan, plan_metrics
+from query_fingerprint import fingerprint_query
+from request_timings import measure
+from serialization import dumps
+from .resilience import CircuitBreaker, QueryTimeoutError, call_with_reconnect
+
+DEFAULT_STATEMENT_TIMEOUT_MS = 60000
+DEFAULT_IDLE_IN_TRANSACTION_TIMEOUT_MS = 10000
+
+def session_timeout_settings(env_prefix: str) -> dict:
+    # Enforced by the server, so abandoned queries stop even if the API never cancels them
+    return {
+        "statement_timeout": os.getenv(
+            f"{env_prefix}_STATEMENT_TIMEOUT_MS", str(DEFAULT_STATEMENT_TIMEOUT_MS)
+        ),
+        "idle_in_transaction_session_timeout": os.getenv(
+            f"{env_prefix}_IDLE_IN_TRANSACTION_TIMEOUT_MS", str(DEFAULT_IDLE_IN_TRANSACTION_TIMEOUT_MS)
+        ),
+    }
 
 @dataclass
 class QueryOutput:
     title: str
     content: str
     latency_ms: Optional[float] = None
+    # Parsed EXPLAIN (FORMAT JSON) tree, on plan outputs only
+    plan: Optional[Dict[str, Any]] = None
+    # Rows returned, on result outputs only
+    rows: Optional[int] = None
 
 @dataclass
 class QueryResult:
@@ -18,6 +44,19 @@ class QueryResult:
     latency_ms: float
     outputs: List[QueryOutput]
 
+    @property
+    def plan(self) -> Optional[Dict[str, Any]]:
+        return next((output.plan for output in self.outputs if output.plan is not None), None)
+
+    @property
+    def row_count(self) -> Optional[int]:
+        return next((output.rows for output in self.outputs if output.rows is not None), None)
+
+    @property
+    def failed(self) -> bool:
+        # SQL errors come back as an output rather than an exception
+        return any(output.title == "SQL Error" for output in self.outputs)
+
 class QueryLock:
     _instance = None
     _lock: asyncio.Lock
@@ -29,16 +68,25 @@ class QueryLock:
             cls._instance._lock = asyncio.Lock()
         return cls._instance
 
-    async def execute_with_lock(self, coro, timeout: Optional[float] = None):
+    async def execute_with_lock(self, coro, timeout: Optional[float] = None, timing_name: Optional[str] = None):
         timeout_val = timeout if timeout is not None else self._timeout
 
-        async with self._lock:
-            try:
-                return await asyncio.wait_for(coro, timeout=timeout_val)
-            except asyncio.TimeoutError:
-                raise TimeoutError(f"Query execution exceeded {timeout_val}s timeout")
+        with measure(f"{timing_name}.queue" if timing_name else "queue"):
+            await self._lock.acquire()
+
+        try:
+            return await asyncio.wait_for(coro, timeout=timeout_val)
+        except asyncio.TimeoutError:
+            raise QueryTimeoutError(f"Query execution exceeded {timeout_val}s timeout")
+        finally:
+            self._lock.release()
 
 class DatabaseConnector(ABC):
+    settings_env_prefix = "DB"
+    # Replay an operation once after a lost connection. Only safe where a
+    # query cannot have been what took the server down.
+    retry_after_reconnect = True
+
     def __init__(self, name: str, host: str, port: int, user: str, password: str, database: str):
         self.name = name
         self.host = host
@@ -47,6 +95,12 @@ class DatabaseConnector(ABC):
         self.password = password
         self.database = database
         self.query_lock = QueryLock()
+        self.conn = None
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=int(os.getenv("DB_BREAKER_THRESHOLD", "3")),
+            reset_timeout=float(os.getenv("DB_BREAKER_RESET_SECONDS", "30"))
+        )
 
     @abstractmethod
     async def connect(self):
@@ -56,6 +110,25 @@ class DatabaseConnector(ABC):
     async def disconnect(self):
         pass
 
+    def server_settings(self) -> dict:
+        return session_timeout_settings(self.settings_env_prefix)
+
+    async def ensure_connected(self):
+        if self.conn is None or self.conn.is_closed():
+            self.conn = None
+            with measure(f"{self.name}.connect"):
+                await self.connect()
+
+    def discard_connection(self):
+        if self.conn is not None:
+            self.conn.terminate()
+            self.conn = None
+
+    async def call_with_reconnect(self, operation, retry: Optional[bool] = None):
+        if retry is None:
+            retry = self.retry_after_reconnect
+        return await call_with_reconnect(operation, self.discard_connection, self.breaker, retry=retry)
+
     @abstractmethod
     async def get_version(self) -> str:
         pass
@@ -99,10 +172,15 @@ class DatabaseConnector(ABC):
         if not self.validate_readonly_query(query):
             raise ValueError("Query contains write operations and is not allowed")
 
-        outputs = await self.query_lock.execute_with_lock(self._execute_query(query))
+        # Validated read-only, so connectors with retry_after_reconnect get a
+        # single retry after a reconnect
+        outputs = await self.call_with_reconnect(
+            lambda: self.query_lock.execute_with_lock(self._execute_query(query), timing_name=self.name)
+        )
         latency_ms = sum(output.latency_ms for output in outputs if output.latency_ms is not None)
 
-        version = await self.get_version()
+        with measure(f"{self.name}.version"):
+            version = await self.call_with_reconnect(self.get_version)
 
         return QueryResult(
             database=self.name,
@@ -110,3 +188,35 @@ class DatabaseConnector(ABC):
             latency_ms=round(latency_ms, 2),
             outputs=outputs
         )
+
+    async def explain(self, query: str) -> Tuple[Dict[str, Any], Optional[float]]:
+        # Estimated plans don't depend on the run, so they're reused by
+        # fingerprint instead of costing another round-trip after every query
+        fingerprint = fingerprint_query(query)
+        plan = await get_cached_plan(fingerprint, self.name)
+        if plan is not None:
+            return plan, None
+
+        start = time.perf_counter()
+        explain = await self.conn.fetchval(f"EXPLAIN (FORMAT JSON) {query}")
+        plan_latency = (time.perf_counter() - start) * 1000
+
+        plan = parse_plan(load_explain(explain))
+        await cache_plan(fingerprint, self.name, dumps(plan), dumps(plan_metrics(plan)))
+        return plan, plan_latency
+
+    async def run_timed(self, query: str) -> Tuple[float, int]:
+        # Bare execution for benchmarking: no EXPLAIN, formatting or version
+        # lookup, so only the query itself is timed
+        if not self.validate_readonly_query(query):
+            raise ValueError("Query contains write operations and is not allowed")
+
+        async def execute():
+            await self.ensure_connected()
+            start = time.perf_counter()
+            rows = await self.conn.fetch(query)
+            return (time.perf_counter() - start) * 1000, len(rows)
+
+        return await self.call_with_reconnect(
+            lambda: self.query_lock.execute_with_lock(execute(), timing_name=self.name)
+        )
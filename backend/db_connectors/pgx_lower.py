@@ -1,8 +1,13 @@
 import asyncpg
 from typing import List
+from plan_analysis import render_plan
 from .base import DatabaseConnector, QueryOutput
 
 class PgxLowerConnector(DatabaseConnector):
+    settings_env_prefix = "PGX_LOWER"
+    # A query that crashed the backend would only crash it again
+    retry_after_reconnect = False
+
     def __init__(self, host: str = "localhost", port: int = 5434,
                  user: str = "pgxuser", password: str = "pgxpassword",
                  database: str = "pgxdb"):
@@ -22,7 +27,8 @@ class PgxLowerConnector(DatabaseConnector):
             port=self.port,
             user=self.user,
             password=self.password,
-            database=self.database
+            database=self.database,
+            server_settings=self.server_settings()
         )
 
     async def disconnect(self):
@@ -31,8 +37,7 @@ class PgxLowerConnector(DatabaseConnector):
             self.conn = None
 
     async def get_version(self) -> str:
-        if not self.conn:
-            await self.connect()
+        await self.ensure_connected()
 
         pg_version = await self.conn.fetchval("SELECT version()")
         pg_parts = pg_version.split()
@@ -46,8 +51,7 @@ class PgxLowerConnector(DatabaseConnector):
         pass
 
     async def _execute_query(self, query: str) -> List[QueryOutput]:
-        if not self.conn:
-            await self.connect()
+        await self.ensure_connected()
 
         outputs = []
 
@@ -74,16 +78,13 @@ class PgxLowerConnector(DatabaseConnector):
             latency_ms=round(query_latency, 2)
         ))
 
-        start = time.time()
-        plan_results = await self.conn.fetch(f"EXPLAIN {query}")
-        plan_latency = (time.time() - start) * 1000
-
-        plan_content = "\n".join(row['QUERY PLAN'] for row in plan_results)
+        plan, plan_latency = await self.explain(query)
 
         outputs.append(QueryOutput(
             title="Optimized Query Plan",
-            content=plan_content,
-            latency_ms=round(plan_latency, 2)
+            content=render_plan(plan),
+            latency_ms=round(plan_latency, 2) if plan_latency is not None else None,
+            plan=plan
         ))
 
         return outputs
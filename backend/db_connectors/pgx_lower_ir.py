@@ -4,11 +4,16 @@ import time
 import subprocess
 import os
 from typing import List, Dict, Optional
+from plan_analysis import render_plan
 from .base import DatabaseConnector, QueryOutput, QueryResult
 from ir_extractor import IRExtractor
 
 
 class PgxLowerIRConnector(DatabaseConnector):
+    settings_env_prefix = "PGX_LOWER"
+    # A query that crashed the backend would only crash it again
+    retry_after_reconnect = False
+
     def __init__(self, host: Optional[str] = None, port: Optional[int] = None,
                  user: Optional[str] = None, password: Optional[str] = None,
                  database: Optional[str] = None, container_name: str = "pgx-lower-dev"):
@@ -36,7 +41,8 @@ class PgxLowerIRConnector(DatabaseConnector):
             port=self.port,
             user=self.user,
             password=self.password,
-            database=self.database
+            database=self.database,
+            server_settings=self.server_settings()
         )
 
     async def disconnect(self):
@@ -45,8 +51,7 @@ class PgxLowerIRConnector(DatabaseConnector):
             self.conn = None
 
     async def get_version(self) -> str:
-        if not self.conn:
-            await self.connect()
+        await self.ensure_connected()
 
         pg_version = await self.conn.fetchval("SELECT version()")
         pg_parts = pg_version.split()
@@ -97,8 +102,7 @@ class PgxLowerIRConnector(DatabaseConnector):
         return ir_files
 
     async def _execute_query(self, query: str) -> List[QueryOutput]:
-        if not self.conn:
-            await self.connect()
+        await self.ensure_connected()
 
         outputs = []
 
@@ -129,17 +133,14 @@ class PgxLowerIRConnector(DatabaseConnector):
             latency_ms=round(query_latency, 2)
         ))
 
-        start = time.time()
-        plan_results = await self.conn.fetch(f"EXPLAIN {query}")
-        plan_latency = (time.time() - start) * 1000
-
-        plan_content = "\n".join(row['QUERY PLAN'] for row in plan_results)
+        plan, plan_latency = await self.explain(query)
 
 
         outputs.append(QueryOutput(
             title="Query Plan",
-            content=plan_content,
-            latency_ms=round(plan_latency, 2)
+            content=render_plan(plan),
+            latency_ms=round(plan_latency, 2) if plan_latency is not None else None,
+            plan=plan
         ))
 
         return outputs
@@ -148,12 +149,11 @@ class PgxLowerIRConnector(DatabaseConnector):
         if not self.validate_readonly_query(query):
             raise ValueError("Query contains write operations and is not allowed")
 
-        if not self.conn:
-            await self.connect()
+        await self.ensure_connected()
 
         IRExtractor.ensure_ir_directory()
 
-        removed = IRExtractor.cleanup_all_ir_files()
+        removed = await IRExtractor.cleanup_all_ir_files_async()
 
         try:
             await self.conn.execute("SET pgx_lower.log_enable = true;")
@@ -178,7 +178,7 @@ class PgxLowerIRConnector(DatabaseConnector):
                     for filename, content in ir_files
                 ]
             else:
-                ir_stages = IRExtractor.extract_ir_stages()
+                ir_stages = await IRExtractor.extract_ir_stages_async()
 
             version = await self.get_version()
 
@@ -198,4 +198,4 @@ class PgxLowerIRConnector(DatabaseConnector):
             }
 
         finally:
-            removed = IRExtractor.cleanup_all_ir_files()
+            removed = await IRExtractor.cleanup_all_ir_files_async()
@@ -1,8 +1,14 @@
 import asyncpg
+import time
 from typing import List
+from plan_analysis import load_explain, parse_plan, render_plan
+from request_timings import measure, record_timing
 from .base import DatabaseConnector, QueryOutput
+from .resilience import is_connection_error
 
 class PostgresConnector(DatabaseConnector):
+    settings_env_prefix = "POSTGRES"
+
     def __init__(self, host: str = "postgres", port: int = 5432,
                  user: str = "pgxuser", password: str = "pgxpassword",
                  database: str = "pgxdb"):
@@ -22,7 +28,8 @@ class PostgresConnector(DatabaseConnector):
             port=self.port,
             user=self.user,
             password=self.password,
-            database=self.database
+            database=self.database,
+            server_settings=self.server_settings()
         )
 
     async def disconnect(self):
@@ -31,8 +38,7 @@ class PostgresConnector(DatabaseConnector):
             self.conn = None
 
     async def get_version(self) -> str:
-        if not self.conn:
-            await self.connect()
+        await self.ensure_connected()
 
         result = await self.conn.fetchval("SELECT version()")
         version_parts = result.split()
@@ -42,29 +48,35 @@ class PostgresConnector(DatabaseConnector):
         pass
 
     async def _execute_query(self, query: str) -> List[QueryOutput]:
-        if not self.conn:
-            await self.connect()
+        await self.ensure_connected()
 
         outputs = []
-        import time
 
         try:
-            start = time.time()
-            analyze_results = await self.conn.fetch(f"EXPLAIN ANALYZE {query}")
-            analyze_latency = (time.time() - start) * 1000
+            with measure("postgres.explain"):
+                explain = await self.conn.fetchval(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}")
+
+            plan = parse_plan(load_explain(explain))
 
-            analyze_content = "\n".join(row['QUERY PLAN'] for row in analyze_results)
+            # Server-side planning and execution times, as reported by the plan
+            if plan["planning_ms"] is not None:
+                record_timing("postgres.plan", plan["planning_ms"])
+            if plan["execution_ms"] is not None:
+                record_timing("postgres.exec", plan["execution_ms"])
 
             outputs.append(QueryOutput(
                 title="Query Plan (EXPLAIN ANALYZE)",
-                content=analyze_content,
-                latency_ms=None
+                content=render_plan(plan),
+                latency_ms=None,
+                plan=plan
             ))
 
             start = time.time()
             results = await self.conn.fetch(query)
             query_latency = (time.time() - start) * 1000
+            record_timing("postgres.fetch", query_latency)
 
+            format_start = time.perf_counter()
             if results:
                 columns = list(results[0].keys())
                 table_lines = [" | ".join(columns)]
@@ -77,14 +89,19 @@ class PostgresConnector(DatabaseConnector):
                 content = "\n".join(table_lines)
             else:
                 content = "No results returned"
+            record_timing("postgres.format", (time.perf_counter() - format_start) * 1000)
 
             outputs.append(QueryOutput(
                 title="Query Results",
                 content=content,
-                latency_ms=round(query_latency, 2)
+                latency_ms=round(query_latency, 2),
+                rows=len(results)
             ))
 
         except Exception as e:
+            if is_connection_error(e):
+                raise
+
             outputs.append(QueryOutput(
                 title="SQL Error",
                 content=f"{type(e).__name__}: {str(e)}",
@@ -0,0 +1,159 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+import asyncpg
+from logger import logger
+
+T = TypeVar("T")
+
+RECONNECT_BASE_DELAY = 0.2
+RECONNECT_MAX_DELAY = 5.0
+
+# Errors that mean the session (not the query) is broken: refused or timed out
+# connects, closed sockets, and the server terminating or crash-restarting
+CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.exceptions.AdminShutdownError,
+    asyncpg.exceptions.CrashShutdownError,
+    asyncpg.exceptions.CannotConnectNowError,
+)
+
+
+class QueryTimeoutError(TimeoutError):
+    pass
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def is_connection_error(error: BaseException) -> bool:
+    if isinstance(error, QueryTimeoutError):
+        return False
+    return isinstance(error, CONNECTION_ERRORS)
+
+
+def backoff_delay(attempt: int, base: float = RECONNECT_BASE_DELAY, cap: float = RECONNECT_MAX_DELAY) -> float:
+    # Full jitter, so API workers reconnecting after a crash do not stampede
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allows_request(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        return state == "half_open" and not self._trial_in_flight
+
+    def before_call(self) -> None:
+        state = self.state
+        if state == "closed":
+            return
+
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return
+
+        retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(
+            f"{self.name} is unavailable after {self.consecutive_failures} consecutive connection "
+            f"failures; next attempt in {retry_in:.0f}s"
+        )
+
+    def release_trial(self) -> None:
+        self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("Circuit for %s closed", self.name)
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        trial_failed = self._trial_in_flight
+        self._trial_in_flight = False
+
+        if trial_failed or self.consecutive_failures >= self.failure_threshold:
+            if self.opened_at is None or trial_failed:
+                logger.warning(
+                    "Circuit for %s opened for %.0fs "
+                    "after %s consecutive connection failures",
+                    self.name, self.reset_timeout, self.consecutive_failures
+                )
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures
+        }
+
+
+async def call_with_reconnect(
+    operation: Callable[[], Awaitable[T]],
+    discard_connection: Callable[[], None],
+    breaker: CircuitBreaker,
+    retry: bool = False,
+    retry_if: Optional[Callable[[BaseException], bool]] = None
+) -> T:
+    # retry allows the one retry for any connection error; retry_if, when
+    # given, can still allow it for errors it accepts
+    attempts = 2 if retry or retry_if else 1
+
+    for attempt in range(attempts):
+        breaker.before_call()
+        try:
+            result = await operation()
+        except asyncio.CancelledError:
+            breaker.release_trial()
+            raise
+        except Exception as e:
+            if not is_connection_error(e):
+                breaker.record_success()
+                raise
+
+            discard_connection()
+            if attempt == 0:
+                breaker.record_failure()
+            # A failed retry is the same incident as the first attempt, so it
+            # does not count twice towards opening the circuit
+            if (
+                attempt + 1 >= attempts
+                or not breaker.allows_request()
+                or not (retry or retry_if(e))
+            ):
+                raise
+
+            delay = backoff_delay(attempt)
+            logger.warning(
+                "Connection to %s lost (%s: %s), "
+                "reconnecting and retrying in %.2fs",
+                breaker.name, type(e).__name__, e, delay
+            )
+            await asyncio.sleep(delay)
+            continue
+
+        breaker.record_success()
+        return result
@@ -1,17 +1,24 @@
 import secrets
 import base64
+import os
 from logger import logger
 from database import compute_hourly_stats
+from process_lock import SHARED_STATE
 
-DEBUG_KEY = base64.urlsafe_b64encode(secrets.token_bytes(15))[:20].decode('utf-8')
+DEBUG_KEY = os.getenv("DEBUG_KEY") or base64.urlsafe_b64encode(secrets.token_bytes(15))[:20].decode('utf-8')
 
 def init_debug():
     logger.info(f"=" * 80)
     logger.info(f"DEBUG KEY: {DEBUG_KEY}")
     logger.info(f"=" * 80)
+    if SHARED_STATE and not os.getenv("DEBUG_KEY"):
+        logger.warning("Running multiple workers without DEBUG_KEY set; each worker has its own debug key")
+
+def valid_debug_key(key: str) -> bool:
+    return secrets.compare_digest(key or "", DEBUG_KEY)
 
 async def handle_debug_request(key: str, request: str, content: str = ""):
-    if key != DEBUG_KEY:
+    if not valid_debug_key(key):
         logger.warning(f"Invalid debug key attempt: {key}")
         return {"error": "Invalid debug key"}
 
@@ -23,6 +30,38 @@ async def handle_debug_request(key: str, request: str, content: str = ""):
         return await debug_query_log_count()
     elif request == "clear_stats":
         return await debug_clear_stats()
+    elif request == "pgx_lower_pool":
+        return await debug_pgx_lower_pool()
+    elif request == "rate_limiter":
+        return await debug_rate_limiter()
+    elif request == "analytics":
+        return debug_analytics()
+    elif request == "jobs":
+        return debug_jobs()
+    elif request == "profile":
+        return await debug_profile(content)
+    elif request == "profile_query":
+        return await debug_profile_query(content)
+    elif request == "memory_start":
+        return debug_memory_start(content)
+    elif request == "memory_stop":
+        return debug_memory_stop()
+    elif request == "memory_snapshot":
+        return await debug_memory_snapshot(content)
+    elif request == "memory_diff":
+        return await debug_memory_diff(content)
+    elif request == "memory_objects":
+        return await debug_memory_objects(content)
+    elif request == "loop_monitor":
+        return await debug_loop_monitor(content)
+    elif request == "log_level":
+        return debug_log_level(content)
+    elif request == "slow_queries":
+        return await debug_slow_queries(content)
+    elif request == "slow_query":
+        return await debug_slow_query(content)
+    elif request == "slow_queries_export":
+        return await debug_slow_queries_export(content)
     elif request == "info":
         return debug_info()
     else:
@@ -71,6 +110,201 @@ async def debug_clear_stats():
         logger.error(f"Error in debug_clear_stats: {str(e)}")
         return {"status": "error", "message": str(e)}
 
+async def debug_pgx_lower_pool():
+    from pgx_lower_query import get_executor
+
+    try:
+        pool = await get_executor()
+        return {
+            "status": "success",
+            "strategy": pool.strategy,
+            "instances": pool.status()
+        }
+    except Exception as e:
+        logger.error("Error in debug_pgx_lower_pool: %s", e)
+        return {"status": "error", "message": str(e)}
+
+async def debug_rate_limiter():
+    from main import rate_limiters
+
+    return {
+        "status": "success",
+        "limiters": {name: await limiter.snapshot() for name, limiter in rate_limiters.items()}
+    }
+
+def debug_analytics():
+    from analytics import analytics
+
+    return {"status": "success", "analytics": analytics.stats()}
+
+def debug_jobs():
+    from main import query_jobs
+
+    return {"status": "success", "jobs": query_jobs.stats()}
+
+async def debug_slow_queries(content: str):
+    from database import get_slow_queries
+
+    # content: optional engine name to filter on
+    try:
+        return {"status": "success", "slow_queries": await get_slow_queries(database=content or None)}
+    except Exception as e:
+        logger.error("Error in debug_slow_queries: %s", e)
+        return {"status": "error", "message": str(e)}
+
+async def debug_slow_query(content: str):
+    from database import get_slow_query
+
+    if not content.isdigit():
+        return {"status": "error", "message": "content must be a slow query id"}
+
+    record = await get_slow_query(int(content))
+    if record is None:
+        return {"status": "error", "message": f"No slow query with id {content}"}
+    return {"status": "success", "slow_query": record}
+
+async def debug_slow_queries_export(content: str):
+    from database import SLOW_QUERY_LOG_SIZE, get_slow_queries
+    from fastapi.responses import Response
+    import orjson
+
+    try:
+        records = await get_slow_queries(limit=SLOW_QUERY_LOG_SIZE, database=content or None, details=True)
+    except Exception as e:
+        logger.error("Error in debug_slow_queries_export: %s", e)
+        return {"status": "error", "message": str(e)}
+
+    # One record per line, oldest first, for loading with pandas/jq
+    body = b"".join(orjson.dumps(record) + b"\n" for record in reversed(records))
+    return Response(
+        content=body,
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="slow_queries.ndjson"'}
+    )
+
+async def debug_profile(content: str):
+    from profiler import ProfilerBusyError, profile_for
+
+    try:
+        return {"status": "success", "profile": await profile_for(float(content) if content else 10.0)}
+    except ValueError:
+        return {"status": "error", "message": "content must be a positive number of seconds"}
+    except ProfilerBusyError as e:
+        return {"status": "error", "message": str(e)}
+
+async def debug_profile_query(content: str):
+    from logger import log_request_id
+    from main import MAX_QUERY_LENGTH, execute_uncached_query
+    from profiler import ProfilerBusyError, profile_call
+    from request_timings import start_request_timings
+    import hashlib
+    import orjson
+
+    if not content or len(content) > MAX_QUERY_LENGTH:
+        return {"status": "error", "message": "content must be the SQL query to profile"}
+
+    # Runs the full uncached path (both engines, IR, caching), bypassing the
+    # response cache and the coalescer so the query really executes
+    request_id = hashlib.md5(content.encode()).hexdigest()
+    log_request_id.set(request_id)
+    timings = start_request_timings()
+    try:
+        profiled = await profile_call(lambda: execute_uncached_query(content, request_id, None))
+    except ProfilerBusyError as e:
+        return {"status": "error", "message": str(e)}
+    except Exception as e:
+        logger.error("Error in debug_profile_query: %s", e)
+        return {"status": "error", "message": str(e)}
+
+    result = orjson.loads(profiled["result"])
+    return {
+        "status": "success",
+        "engines": {entry["database"]: entry["latency_ms"] for entry in result["results"]},
+        "timings": timings.as_dict(),
+        "profile": profiled["profile"],
+    }
+
+def debug_memory_start(content: str):
+    from memory_debug import MEMORY_TRACE_FRAMES, start_tracing
+
+    # content: traceback depth to record (default MEMORY_TRACE_FRAMES)
+    try:
+        frames = int(content) if content else MEMORY_TRACE_FRAMES
+    except ValueError:
+        return {"status": "error", "message": "content must be a number of frames"}
+
+    try:
+        return {"status": "success", "memory": start_tracing(frames)}
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+def debug_memory_stop():
+    from memory_debug import stop_tracing
+
+    return {"status": "success", "memory": stop_tracing()}
+
+async def debug_memory_snapshot(content: str):
+    from memory_debug import take_snapshot
+
+    # content: "[label] [lineno|filename|traceback]"
+    args = content.split()
+    try:
+        snapshot = await take_snapshot(
+            label=args[0] if args else None,
+            group_by=args[1] if len(args) > 1 else "lineno"
+        )
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    return {"status": "success", "snapshot": snapshot}
+
+async def debug_memory_diff(content: str):
+    from memory_debug import diff_snapshots
+
+    # content: "[old new] [lineno|filename|traceback]"; defaults to the last two
+    args = content.split()
+    group_by = args.pop() if len(args) in (1, 3) else "lineno"
+    try:
+        diff = await diff_snapshots(*args[:2], group_by=group_by)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    return {"status": "success", "diff": diff}
+
+async def debug_memory_objects(content: str):
+    from memory_debug import MEMORY_TOP_LIMIT, object_census
+
+    limit = int(content) if content.isdigit() else MEMORY_TOP_LIMIT
+    return {"status": "success", "objects": await object_census(limit)}
+
+async def debug_loop_monitor(content: str):
+    from loop_monitor import loop_monitor
+
+    # content: "on", "off", a block threshold in ms, or empty for status
+    if content == "on":
+        loop_monitor.start()
+    elif content == "off":
+        await loop_monitor.stop()
+    elif content:
+        try:
+            loop_monitor.set_threshold(float(content))
+        except ValueError:
+            return {"status": "error", "message": "content must be on, off or a positive threshold in ms"}
+
+    return {"status": "success", "loop_monitor": loop_monitor.status()}
+
+def debug_log_level(content: str):
+    # content: "LEVEL" for the default, "module=LEVEL" for one module
+    # ("module=default" clears it), or empty to list the current levels
+    try:
+        if "=" in content:
+            module, level = content.split("=", 1)
+            logger.set_level(level, module=module.strip())
+        elif content:
+            logger.set_level(content)
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+    return {"status": "success", "levels": logger.levels()}
+
 def debug_info():
     return {
         "status": "success",
@@ -78,6 +312,22 @@ def debug_info():
             "compute_stats - Manually trigger hourly stats computation",
             "query_log_count - Get query log statistics",
             "clear_stats - Clear performance_stats table",
+            "pgx_lower_pool - Show pgx-lower instance health and load",
+            "rate_limiter - Show rate limiter occupancy and rejection counters",
+            "analytics - Show analytics queue depth and delivery counters",
+            "jobs - Show background query job queue and status counts",
+            "profile - Sample all threads for N seconds (content: seconds, default 10)",
+            "profile_query - Profile one uncached /query execution end to end (content: SQL)",
+            "memory_start - Start tracemalloc (content: traceback frames, default 1)",
+            "memory_stop - Stop tracemalloc and drop snapshots",
+            "memory_snapshot - Take a snapshot and list top allocations (content: [label] [lineno|filename|traceback])",
+            "memory_diff - Diff two snapshots (content: [old new] [lineno|filename|traceback]; default last two)",
+            "memory_objects - Largest live object types and gc generation stats (content: limit)",
+            "loop_monitor - Event loop lag and recent stalls (content: on, off or block threshold ms)",
+            "log_level - Show or set log levels (content: LEVEL, module=LEVEL or module=default)",
+            "slow_queries - List recent slow queries (content: optional engine name)",
+            "slow_query - Show one slow query with plan and breakdown (content: id)",
+            "slow_queries_export - Download the slow query log as NDJSON (content: optional engine name)",
             "info - Show this information"
         ]
     }
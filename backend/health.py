@@ -14,12 +14,15 @@ app.add_middleware(
 )
 
 start_time = time.time()
+# Primes the counter so each /health reports usage since the previous call
+# without blocking the event loop for a sampling interval
+psutil.cpu_percent(interval=None)
 
 @app.get("/health")
 async def health():
     uptime = int(time.time() - start_time)
 
-    cpu_percent = psutil.cpu_percent(interval=0.1)
+    cpu_percent = psutil.cpu_percent(interval=None)
     memory = psutil.virtual_memory()
     swap = psutil.swap_memory()
     disk = psutil.disk_usage('/')
@@ -1,28 +1,55 @@
-import glob
+import mmap
 import os
+import fnmatch
 from pathlib import Path
 from typing import List, Dict, Optional
 from datetime import datetime
 import asyncio
+from ir_phase_names import get_ir_phase_order
 
 
 class IRExtractor:
     IR_TEMP_DIR = "/tmp/pgx_ir"
     IR_FILE_PATTERN = "pgx_lower_*.mlir"
+    MMAP_THRESHOLD_BYTES = 1024 * 1024
 
     @staticmethod
     def ensure_ir_directory() -> None:
         Path(IRExtractor.IR_TEMP_DIR).mkdir(parents=True, exist_ok=True)
 
     @staticmethod
-    def cleanup_all_ir_files() -> int:
-        pattern = os.path.join(IRExtractor.IR_TEMP_DIR, IRExtractor.IR_FILE_PATTERN)
-        files = glob.glob(pattern)
+    def _scan_ir_files() -> List[os.DirEntry]:
+        try:
+            with os.scandir(IRExtractor.IR_TEMP_DIR) as entries:
+                return [
+                    entry for entry in entries
+                    if fnmatch.fnmatch(entry.name, IRExtractor.IR_FILE_PATTERN)
+                    and entry.is_file()
+                ]
+        except FileNotFoundError:
+            return []
+
+    @staticmethod
+    def _read_ir_file(entry: os.DirEntry) -> str:
+        size = entry.stat().st_size
+        with open(entry.path, 'rb') as f:
+            if size < IRExtractor.MMAP_THRESHOLD_BYTES:
+                return f.read().decode('utf-8', errors='replace')
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                # Decodes straight from the mapping, without a bytes copy first
+                return str(mapped, 'utf-8', 'replace')
+
+    @staticmethod
+    def _ir_file_sort_key(filename: str):
+        # Filenames end in a timestamp, so equal phases still sort by write order
+        return (get_ir_phase_order(IRExtractor.parse_ir_stage_name(filename)), filename)
 
+    @staticmethod
+    def cleanup_all_ir_files() -> int:
         removed_count = 0
-        for filepath in files:
+        for entry in IRExtractor._scan_ir_files():
             try:
-                os.remove(filepath)
+                os.remove(entry.path)
                 removed_count += 1
             except OSError as e:
                 pass
@@ -30,18 +57,19 @@ class IRExtractor:
         return removed_count
 
     @staticmethod
-    def collect_ir_files() -> List[tuple[str, str]]:
-        pattern = os.path.join(IRExtractor.IR_TEMP_DIR, IRExtractor.IR_FILE_PATTERN)
-        files = sorted(glob.glob(pattern), key=os.path.getmtime)
+    def collect_ir_files() -> List[tuple[str, str, float]]:
+        entries = sorted(
+            IRExtractor._scan_ir_files(),
+            key=lambda entry: IRExtractor._ir_file_sort_key(entry.name)
+        )
 
         ir_files = []
-        for filepath in files:
+        for entry in entries:
             try:
-                with open(filepath, 'r') as f:
-                    content = f.read()
-                    filename = os.path.basename(filepath)
-                    ir_files.append((filename, content))
-            except IOError as e:
+                # Write time marks when the compiler finished the phase
+                written_at = entry.stat().st_mtime_ns / 1e9
+                ir_files.append((entry.name, IRExtractor._read_ir_file(entry), written_at))
+            except (OSError, ValueError) as e:
                 pass
 
         return ir_files
@@ -67,16 +95,25 @@ class IRExtractor:
         ir_files = IRExtractor.collect_ir_files()
 
         stages = []
-        for filename, content in ir_files:
+        for filename, content, written_at in ir_files:
             stage_name = IRExtractor.parse_ir_stage_name(filename)
             stages.append({
                 "stage": stage_name,
                 "content": content,
-                "filename": filename
+                "filename": filename,
+                "written_at": written_at
             })
 
         return stages
 
+    @staticmethod
+    async def cleanup_all_ir_files_async() -> int:
+        return await asyncio.to_thread(IRExtractor.cleanup_all_ir_files)
+
+    @staticmethod
+    async def extract_ir_stages_async() -> List[Dict[str, str]]:
+        return await asyncio.to_thread(IRExtractor.extract_ir_stages)
+
     @staticmethod
     async def execute_with_ir_collection(
             query_executor,
@@ -85,7 +122,7 @@ class IRExtractor:
     ) -> Dict:
         IRExtractor.ensure_ir_directory()
 
-        removed = IRExtractor.cleanup_all_ir_files()
+        removed = await IRExtractor.cleanup_all_ir_files_async()
 
         try:
             await connection_obj.execute("SET pgx_lower.log_enable = true;")
@@ -97,7 +134,7 @@ class IRExtractor:
 
             await asyncio.sleep(0.1)
 
-            ir_stages = IRExtractor.extract_ir_stages()
+            ir_stages = await IRExtractor.extract_ir_stages_async()
 
             return {
                 "results": results,
@@ -105,4 +142,4 @@ class IRExtractor:
             }
 
         finally:
-            removed = IRExtractor.cleanup_all_ir_files()
+            removed = await IRExtractor.cleanup_all_ir_files_async()
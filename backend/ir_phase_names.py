@@ -27,3 +27,24 @@ def get_ir_phase_order(raw_name: str):
     if result:
         return result[1]
     return 999
+
+
+# Compiler categories in pipeline order, and the category each dump closes.
+# A category's end time is the write time of its last dump.
+IR_PHASE_CATEGORIES = ("AST_TRANSLATE", "RELALG_LOWER", "DB_LOWER", "JIT")
+
+IR_PHASE_CATEGORY_MAP = {
+    "Phase 3a before optimization": "AST_TRANSLATE",
+    "Phase 3a AFTER: RelAlg -> Optimised RelAlg": "RELALG_LOWER",
+    "Phase 3a AFTER: RelAlg -> DB+DSA+Util": "RELALG_LOWER",
+    "Phase 3b BEFORE: DB+DSA -> Standard": "RELALG_LOWER",
+    "After dsa standard pipeline pm1": "DB_LOWER",
+    "After dsa standard pipeline pm2": "DB_LOWER",
+    "After func pipeline": "DB_LOWER",
+    "Phase 3c BEFORE: Standard -> LLVM": "DB_LOWER",
+    "Phase 3c AFTER: Standard -> LLVM": "JIT",
+}
+
+
+def get_ir_phase_category(raw_name: str):
+    return IR_PHASE_CATEGORY_MAP.get(raw_name)
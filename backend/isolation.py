@@ -0,0 +1,51 @@
+import asyncio
+import os
+import random
+from typing import Any, Awaitable, Callable, Dict, List
+
+ISOLATION_MODES = ("concurrent", "sequential", "randomized")
+QUERY_ISOLATION_MODE = os.getenv("QUERY_ISOLATION_MODE", "concurrent")
+QUERY_ISOLATION_COOLDOWN_MS = float(os.getenv("QUERY_ISOLATION_COOLDOWN_MS", "0"))
+
+# cpusets the engine containers are pinned to (docker-compose passes the same
+# values to their cpuset); recorded so published numbers state the placement
+ENGINE_CPUSETS = {
+    "postgres": os.getenv("POSTGRES_CPUSET", ""),
+    "pgx-lower": os.getenv("PGX_LOWER_CPUSET", ""),
+}
+
+if QUERY_ISOLATION_MODE not in ISOLATION_MODES:
+    raise ValueError(f"Unknown query isolation mode: {QUERY_ISOLATION_MODE}")
+
+
+def isolation_plan(engines: List[str]) -> Dict[str, Any]:
+    order = list(engines)
+    if QUERY_ISOLATION_MODE == "randomized":
+        random.shuffle(order)
+
+    plan: Dict[str, Any] = {"mode": QUERY_ISOLATION_MODE, "order": order}
+    if QUERY_ISOLATION_MODE != "concurrent":
+        plan["cooldown_ms"] = QUERY_ISOLATION_COOLDOWN_MS
+
+    affinity = {engine: ENGINE_CPUSETS[engine] for engine in engines if ENGINE_CPUSETS.get(engine)}
+    if affinity:
+        plan["cpusets"] = affinity
+    return plan
+
+
+async def run_engines(plan: Dict[str, Any], runners: Dict[str, Callable[[], Awaitable[Any]]]) -> Dict[str, Any]:
+    # Concurrent runs both engines at once, which is best for throughput but
+    # lets them compete for CPU and memory bandwidth; the other modes run one
+    # engine at a time with an optional pause so the host settles in between
+    order = plan["order"]
+
+    if plan["mode"] == "concurrent":
+        results = await asyncio.gather(*(runners[engine]() for engine in order))
+        return dict(zip(order, results))
+
+    results = {}
+    for position, engine in enumerate(order):
+        if position and plan.get("cooldown_ms"):
+            await asyncio.sleep(plan["cooldown_ms"] / 1000)
+        results[engine] = await runners[engine]()
+    return results
@@ -1,12 +1,88 @@
+import atexit
+import copy
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from typing import Dict, Optional
 import sys
 import os
 
 LOG_DIR = Path(os.getenv("LOG_PATH", Path(__file__).parent.parent / "logs"))
 LOG_DIR.mkdir(exist_ok=True, parents=True)
 
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" (default) or "json", one object per line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Per-module overrides by module file name, e.g. "pgx_lower_query=DEBUG,analytics=WARNING"
+LOG_MODULE_LEVELS = os.getenv("LOG_MODULE_LEVELS", "")
+
+# Set by request handlers so every line logged while serving a query carries its id
+log_request_id: ContextVar[Optional[str]] = ContextVar("log_request_id", default=None)
+
+
+def parse_level(level: str) -> int:
+    value = logging.getLevelName(level.strip().upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return value
+
+
+def parse_module_levels(value: str) -> Dict[str, int]:
+    levels = {}
+    for item in value.split(","):
+        if item.strip():
+            module, level = item.split("=", 1)
+            levels[module.strip()] = parse_level(level)
+    return levels
+
+
+class ContextFilter(logging.Filter):
+    # Runs on the calling thread, where the request's context is visible,
+    # before the record is handed to the listener thread. Module levels are
+    # applied here too, since every module logs through the one logger.
+    def __init__(self, default_level: int, module_levels: Dict[str, int]):
+        super().__init__()
+        self.default_level = default_level
+        self.module_levels = module_levels
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.module_levels.get(record.module, self.default_level):
+            return False
+        record.request_id = log_request_id.get()
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    # The stock prepare() formats the record on the calling thread and folds
+    # the traceback into msg. Enqueue a copy with msg, args and exc_info
+    # intact so the listener's formatter does that work (and JsonFormatter
+    # can still emit the traceback as its own field).
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return copy.copy(record)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
 class Logger:
     _instance = None
 
@@ -18,7 +94,8 @@ class Logger:
 
     def _initialize(self):
         self.logger = logging.getLogger("pgx-lower")
-        self.logger.setLevel(logging.INFO)
+        self.context_filter = ContextFilter(parse_level(LOG_LEVEL), parse_module_levels(LOG_MODULE_LEVELS))
+        self._apply_levels()
 
         if self.logger.handlers:
             return
@@ -28,31 +105,67 @@ class Logger:
             maxBytes=10 * 1024 * 1024,
             backupCount=5
         )
-        file_handler.setLevel(logging.INFO)
-
         console_handler = logging.StreamHandler(sys.stdout)
-        console_handler.setLevel(logging.INFO)
 
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            datefmt='%Y-%m-%d %H:%M:%S'
-        )
+        if LOG_FORMAT == "json":
+            formatter = JsonFormatter()
+        else:
+            formatter = logging.Formatter(
+                '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                datefmt='%Y-%m-%d %H:%M:%S'
+            )
         file_handler.setFormatter(formatter)
         console_handler.setFormatter(formatter)
 
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+        # Handlers only enqueue; formatting output, writing and rotating the
+        # file happen on the listener thread, off the event loop
+        log_queue: queue.SimpleQueue = queue.SimpleQueue()
+        queue_handler = DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(self.context_filter)
+        self.logger.addHandler(queue_handler)
+
+        self.listener = QueueListener(log_queue, file_handler, console_handler)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def _apply_levels(self):
+        # The logger lets through the most verbose level any module asks for;
+        # the filter then holds every other module to its own level
+        self.logger.setLevel(min([self.context_filter.default_level, *self.context_filter.module_levels.values()]))
+
+    def set_level(self, level: str, module: Optional[str] = None):
+        if module is None:
+            self.context_filter.default_level = parse_level(level)
+        elif level.strip().lower() == "default":
+            self.context_filter.module_levels.pop(module, None)
+        else:
+            self.context_filter.module_levels[module] = parse_level(level)
+        self._apply_levels()
+
+    def levels(self) -> Dict[str, str]:
+        return {
+            "default": logging.getLevelName(self.context_filter.default_level),
+            **{
+                module: logging.getLevelName(level)
+                for module, level in self.context_filter.module_levels.items()
+            },
+        }
+
+    # Messages take %-style arguments, formatted only if the record is
+    # emitted; stacklevel attributes the record to the caller, not this class
+    def info(self, message: str, *args, **kwargs):
+        self.logger.info(message, *args, stacklevel=2, **kwargs)
 
-    def info(self, message: str):
-        self.logger.info(message)
+    def error(self, message: str, *args, **kwargs):
+        self.logger.error(message, *args, stacklevel=2, **kwargs)
 
-    def error(self, message: str):
-        self.logger.error(message)
+    def warning(self, message: str, *args, **kwargs):
+        self.logger.warning(message, *args, stacklevel=2, **kwargs)
 
-    def warning(self, message: str):
-        self.logger.warning(message)
+    def debug(self, message: str, *args, **kwargs):
+        self.logger.debug(message, *args, stacklevel=2, **kwargs)
 
-    def debug(self, message: str):
-        self.logger.debug(message)
+    def exception(self, message: str, *args, **kwargs):
+        self.logger.exception(message, *args, stacklevel=2, **kwargs)
 
 logger = Logger()
@@ -0,0 +1,150 @@
+import asyncio
+import math
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Dict, List, Optional
+import metrics
+from logger import logger
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_LAG_INTERVAL_MS = float(os.getenv("LOOP_LAG_INTERVAL_MS", "100"))
+LOOP_BLOCK_THRESHOLD_MS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "250"))
+# One minute of samples at the default interval
+LOOP_LAG_WINDOW = 600
+LOOP_STALL_HISTORY = 20
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+# A task on the loop sleeps for a fixed interval and records how late it
+# wakes up (the lag every other callback sees too). A watchdog thread checks
+# the task's heartbeat, and when the loop has not come back for longer than
+# the threshold, logs the loop thread's stack while it is still stuck, which
+# names the blocking call. Both wake a few times a second, so the monitor is
+# meant to stay on in production.
+class LoopMonitor:
+    def __init__(
+        self,
+        interval_ms: float = LOOP_LAG_INTERVAL_MS,
+        threshold_ms: float = LOOP_BLOCK_THRESHOLD_MS
+    ):
+        self.interval = interval_ms / 1000
+        self.set_threshold(threshold_ms)
+        self.lags: deque = deque(maxlen=LOOP_LAG_WINDOW)
+        self.stalls: deque = deque(maxlen=LOOP_STALL_HISTORY)
+        self.stall_count = 0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(
+            "Event loop monitor started (interval %.0f ms, "
+            "block threshold %.0f ms)",
+            self.interval * 1000, self.threshold * 1000
+        )
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+        logger.info("Event loop monitor stopped")
+
+    def set_threshold(self, threshold_ms: float) -> None:
+        # The watchdog polls at a quarter of the threshold, so zero or a
+        # non-finite value would spin it or stop it from ever waking
+        if not math.isfinite(threshold_ms) or threshold_ms <= 0:
+            raise ValueError("threshold must be a positive number of ms")
+        self.threshold = threshold_ms / 1000
+
+    async def _sample(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            lag = max(now - expected, 0.0)
+            self.lags.append(lag)
+            metrics.loop_lag.observe(lag)
+
+    def _watch(self) -> None:
+        reported_heartbeat = None
+        while not self._stop.wait(self.threshold / 4):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.threshold or heartbeat == reported_heartbeat:
+                continue
+
+            # Report each stall once, with the stack as it is right now
+            reported_heartbeat = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+            self.stall_count += 1
+            metrics.loop_stalls.inc()
+            self.stalls.append({
+                "at": time.time(),
+                "blocked_ms": round(blocked * 1000, 1),
+                "stack": stack,
+            })
+            logger.warning("Event loop blocked for %.0f ms so far:\n%s", blocked * 1000, stack)
+
+    def lag_summary(self) -> Dict[str, Optional[float]]:
+        if not self.lags:
+            return {"p50": None, "p99": None, "max": None}
+        ordered = sorted(self.lags)
+        return {
+            "p50": percentile(ordered, 0.5),
+            "p99": percentile(ordered, 0.99),
+            "max": ordered[-1],
+        }
+
+    def publish(self) -> None:
+        for quantile, lag in self.lag_summary().items():
+            if lag is not None:
+                metrics.loop_lag_window.labels(quantile=quantile).set(lag)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "samples": len(self.lags),
+            "lag_ms": {
+                quantile: round(lag * 1000, 2) if lag is not None else None
+                for quantile, lag in self.lag_summary().items()
+            },
+            "stalls": self.stall_count,
+            "recent_stalls": list(self.stalls),
+        }
+
+
+loop_monitor = LoopMonitor()
+metrics.on_collect(loop_monitor.publish)
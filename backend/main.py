@@ -1,25 +1,48 @@
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
+import asyncpg
 import hashlib
-import json
+import os
+import time
 from pathlib import Path
-from database import init_db, log_user_request, get_cached_query, cache_query, log_query_execution, compute_hourly_stats, get_performance_stats, VERSION
-from logger import logger
+from typing import Callable, Optional
+from database import init_db, init_benchmark_db, log_user_request, get_cached_query_raw, is_query_inflight, get_cached_request_ids, cache_query, get_cached_ir, cache_ir, prune_ir_cache, get_cached_plans, cache_plan, log_query_execution, record_query_stats, get_query_stats, QUERY_STATS_ORDERS, compute_hourly_stats, get_performance_stats, VERSION
+from logger import log_request_id, logger
 from db_connectors.postgres import PostgresConnector
 from db_connectors.pgx_lower_ir import PgxLowerIRConnector
-from pgx_lower_query import execute_pgx_lower_query, shutdown_executor
+from db_connectors.resilience import CircuitOpenError, QueryTimeoutError, is_connection_error
+from plan_analysis import plan_metrics
+from slow_query_log import is_slow, record_slow_query
+from pgx_lower_query import PGX_LOWER_WARM_RUN, execute_pgx_lower_query, get_pgx_lower_build_id, get_executor_status, shutdown_executor
+from query_fingerprint import fingerprint_query
+from serialization import dumps, json_response, query_response, raw_json_response, splice_result, sse_event
+from static_assets import StaticAssetIndex
+from query_catalog import QueryCatalog
 from ir_phase_names import normalize_ir_phase_name, get_ir_phase_order
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import asyncio
+from contextlib import suppress
 import debug
-from datetime import datetime, timedelta
-from collections import defaultdict
 from analytics import analytics
+from rate_limiter import SlidingWindowRateLimiter, SharedSlidingWindowRateLimiter
+from query_coalescer import QueryCoalescer
+from benchmark import BenchmarkBudgetError, BenchmarkBusyError, BenchmarkRunner, BENCHMARK_MAX_ITERATIONS, BENCHMARK_MAX_WARMUP
+from isolation import isolation_plan, run_engines
+from loop_monitor import LOOP_MONITOR_ENABLED, loop_monitor
+from query_jobs import ACTIVE_STATUSES, JobQueueFullError, QueryJob, QueryJobManager
+from process_lock import FileLock, SHARED_STATE
+from db_connectors.base import QueryLock
+import metrics
+from metrics import time_stage
+from request_timings import measure, start_request_timings
 
 CONTENT_DIR = Path(__file__).parent / "content"
 RESOURCES_DIR = Path(__file__).parent / "resources"
+content_assets = StaticAssetIndex(CONTENT_DIR)
+resource_assets = StaticAssetIndex(RESOURCES_DIR)
+query_catalog = QueryCatalog(resource_assets)
 
 app = FastAPI(title="pgx-lower API")
 
@@ -43,6 +66,13 @@ class QueryRequest(BaseModel):
 
 MAX_QUERY_LENGTH = 10000
 
+class BenchmarkRequest(BaseModel):
+    query: Optional[str] = None
+    query_id: Optional[int] = None
+    warmup: int = 1
+    iterations: int = 10
+    label: str = "api"
+
 class DebugRequest(BaseModel):
     key: str
     request: str
@@ -52,35 +82,131 @@ postgres_connector = PostgresConnector()
 pgx_lower_ir_connector = PgxLowerIRConnector()
 scheduler = AsyncIOScheduler()
 
-rate_limit_store = defaultdict(lambda: {"cached": [], "uncached": []})
 MAX_CACHED_QUERIES_PER_MINUTE = 100
 MAX_UNCACHED_QUERIES_PER_MINUTE = 10
+MAX_BENCHMARKS_PER_MINUTE = 2
+RATE_LIMIT_MAX_TRACKED_IPS = 100_000
+
+def make_rate_limiter(name: str, limit: int):
+    if SHARED_STATE:
+        return SharedSlidingWindowRateLimiter(name, limit, 60.0, RATE_LIMIT_MAX_TRACKED_IPS)
+    return SlidingWindowRateLimiter(limit, 60.0, RATE_LIMIT_MAX_TRACKED_IPS)
+
+rate_limiters = {
+    "cached": make_rate_limiter("cached", MAX_CACHED_QUERIES_PER_MINUTE),
+    "uncached": make_rate_limiter("uncached", MAX_UNCACHED_QUERIES_PER_MINUTE),
+    "benchmark": make_rate_limiter("benchmark", MAX_BENCHMARKS_PER_MINUTE),
+}
 
-def check_rate_limit(ip_address: str, is_cached: bool) -> bool:
-    now = datetime.now()
-    cutoff = now - timedelta(minutes=1)
+query_coalescer = QueryCoalescer(shared=SHARED_STATE, claim_ttl_seconds=QueryLock._timeout * 2)
+scheduler_leader_lock = FileLock("scheduler-leader")
 
+async def check_rate_limit(ip_address: str, is_cached: bool) -> bool:
     query_type = "cached" if is_cached else "uncached"
-    max_queries = MAX_CACHED_QUERIES_PER_MINUTE if is_cached else MAX_UNCACHED_QUERIES_PER_MINUTE
+    with time_stage("rate_limit"):
+        allowed = await rate_limiters[query_type].check(ip_address)
+    if not allowed:
+        metrics.rate_limit_rejections.labels(limiter=query_type).inc()
+    return allowed
+
+def collect_live_metrics():
+    metrics.queue_depth.labels(queue="analytics").set(analytics.queue.qsize())
+    metrics.queue_depth.labels(queue="coalesced_queries").set(query_coalescer.inflight_count)
+    metrics.queue_depth.labels(queue="jobs").set(query_jobs.queue.qsize())
+    for status in get_executor_status():
+        labels = {"engine": "pgx-lower", "endpoint": status["endpoint"]}
+        metrics.pool_in_flight.labels(**labels).set(status["in_flight"])
+        metrics.pool_healthy.labels(**labels).set(1 if status["healthy"] else 0)
+
+metrics.on_collect(collect_live_metrics)
+
+async def refresh_live_metrics():
+    # A coroutine, so the scheduler runs it on the event loop next to the
+    # state the hooks read rather than in its thread pool
+    metrics.collect_live()
+
+def current_load() -> dict:
+    # What else this worker was doing, recorded with slow queries
+    return {
+        "coalesced_queries": query_coalescer.inflight_count,
+        "job_queue": query_jobs.queue.qsize(),
+        "pgx_lower_in_flight": sum(status["in_flight"] for status in get_executor_status()),
+        "load_average": os.getloadavg()[0],
+    }
+
+async def timed(stage: str, awaitable):
+    with time_stage(stage):
+        return await awaitable
+
+async def capture_exception(awaitable):
+    try:
+        return await awaitable
+    except Exception as e:
+        return e
 
-    rate_limit_store[ip_address][query_type] = [
-        timestamp for timestamp in rate_limit_store[ip_address][query_type]
-        if timestamp > cutoff
-    ]
+async def evict_idle_rate_limits():
+    evicted = 0
+    for limiter in rate_limiters.values():
+        evicted += await limiter.evict()
+    if evicted:
+        logger.info("Evicted %s idle rate limit entries", evicted)
 
-    if len(rate_limit_store[ip_address][query_type]) >= max_queries:
-        return False
+DISCONNECT_POLL_SECONDS = 0.5
+
+async def run_until_disconnect(request: Optional[Request], awaitable):
+    # Starlette keeps running a handler after the client goes away; cancelling
+    # the task makes asyncpg send a protocol-level cancel to the backend.
+    # Background jobs pass no request and always run to completion.
+    if request is None:
+        return await awaitable
+
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+
+            if await request.is_disconnected():
+                ip_address = request.client.host if request.client else "unknown"
+                logger.info("Client %s disconnected, cancelling running query", ip_address)
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if not task.done():
+            task.cancel()
+
+def start_leader_jobs():
+    scheduler.add_job(compute_hourly_stats, 'cron', minute=0, id='hourly_stats')
+    if SHARED_STATE:
+        scheduler.add_job(evict_idle_rate_limits, 'interval', minutes=1, id='rate_limit_eviction')
+    if not scheduler.running:
+        scheduler.start()
+    logger.info("Worker %s is scheduler leader: hourly stats computation at minute 0 of every hour", os.getpid())
+    asyncio.create_task(compute_hourly_stats())
 
-    rate_limit_store[ip_address][query_type].append(now)
-    return True
+async def try_become_leader():
+    if scheduler_leader_lock.try_acquire():
+        scheduler.remove_job('leader_election')
+        start_leader_jobs()
 
 @app.on_event("startup")
 async def startup():
     logger.info("Starting pgx-lower API")
     await init_db()
+    await init_benchmark_db()
     logger.info("Database initialized")
 
     debug.init_debug()
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    analytics.start()
+    query_jobs.start()
+    await content_assets.start()
+    await resource_assets.start()
+
     await postgres_connector.connect()
     logger.info("Connected to PostgreSQL")
 
@@ -91,21 +217,49 @@ async def startup():
     except Exception as e:
         logger.warning(f"Failed to connect to pgx-lower IR connector: {str(e)}. IR extraction will not be available.")
 
-    scheduler.add_job(compute_hourly_stats, 'cron', minute=0, id='hourly_stats')
-    scheduler.start()
-    logger.info("Scheduler started: hourly stats computation at minute 0 of every hour")
-    asyncio.create_task(compute_hourly_stats())
+    build_id = await get_pgx_lower_build_id()
+    if build_id:
+        removed = await prune_ir_cache(build_id)
+        if removed:
+            logger.info("Dropped %s cached IR entries from other pgx-lower builds", removed)
+
+    # Every worker refreshes its own live gauges; the scheduler runs in all of them
+    scheduler.add_job(
+        refresh_live_metrics, 'interval', seconds=metrics.LIVE_METRICS_INTERVAL_SECONDS, id='live_metrics'
+    )
+    if not SHARED_STATE:
+        scheduler.add_job(evict_idle_rate_limits, 'interval', minutes=1, id='rate_limit_eviction')
+        scheduler.start()
+
+    # Shared jobs run only in the worker holding the leader lock; the others
+    # keep trying so a replacement takes over if the leader exits
+    if scheduler_leader_lock.try_acquire():
+        start_leader_jobs()
+    else:
+        logger.info("Worker %s is not the scheduler leader, standing by", os.getpid())
+        scheduler.add_job(try_become_leader, 'interval', seconds=30, id='leader_election')
+        if not scheduler.running:
+            scheduler.start()
 
 @app.on_event("shutdown")
 async def shutdown():
     scheduler.shutdown()
+    scheduler_leader_lock.release()
     logger.info("Scheduler stopped")
     await pgx_lower_ir_connector.disconnect()
     logger.info("Disconnected from pgx-lower IR connector")
+    await query_jobs.close()
+    logger.info("Query job workers stopped")
+    for limiter in rate_limiters.values():
+        await limiter.close()
+    await content_assets.close()
+    await resource_assets.close()
     await shutdown_executor()
     logger.info("Disconnected pgx-lower query executor")
     await analytics.close()
     logger.info("Analytics client closed")
+    await loop_monitor.stop()
+    metrics.mark_process_dead()
 
 @app.get("/")
 async def root():
@@ -115,74 +269,357 @@ async def root():
 async def health():
     return {"status": "ok"}
 
+@app.get("/metrics")
+async def get_metrics():
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
+
 @app.get("/version")
 async def get_version():
     return {"version": VERSION}
 
 @app.get("/content/{filename}")
-async def get_content(filename: str):
-    file_path = CONTENT_DIR / filename
-
-    if not file_path.exists():
+async def get_content(filename: str, request: Request):
+    asset = content_assets.get(filename)
+    if asset is None:
         raise HTTPException(status_code=404, detail="File not found")
 
-    if not str(file_path.resolve()).startswith(str(CONTENT_DIR.resolve())):
-        raise HTTPException(status_code=403, detail="Access denied")
-
     logger.info(f"Serving content file: {filename}")
-    return FileResponse(file_path)
-
-@app.get("/resources/{filename}")
-async def get_resource(filename: str):
-    file_path = RESOURCES_DIR / filename
+    return content_assets.respond(asset, request)
 
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="File not found")
+@app.get("/resources/queries")
+async def get_query_catalog(request: Request):
+    cached_ids = await get_cached_request_ids(query_catalog.request_ids())
+    return await query_catalog.respond(request, frozenset(cached_ids))
 
-    if not str(file_path.resolve()).startswith(str(RESOURCES_DIR.resolve())):
-        raise HTTPException(status_code=403, detail="Access denied")
+@app.get("/resources/{filename}")
+async def get_resource(filename: str, request: Request):
+    asset = resource_assets.get(filename)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Resource not found")
 
     logger.info(f"Serving resource file: {filename}")
-    return FileResponse(file_path)
+    return resource_assets.respond(asset, request)
 
 @app.get("/download/{filename}")
 async def download_file(filename: str, request: Request):
     ip_address = request.client.host if request.client else "unknown"
 
-    file_path = RESOURCES_DIR / filename
-
-    if not file_path.exists():
-        logger.error(f"File not found at {file_path}")
+    asset = resource_assets.get(filename)
+    if asset is None:
+        logger.error("File not found: %s", filename)
         raise HTTPException(status_code=404, detail="File not found")
 
-    if not str(file_path.resolve()).startswith(str(RESOURCES_DIR.resolve())):
-        raise HTTPException(status_code=403, detail="Access denied")
-
     logger.info(f"Download request from {ip_address}: {filename}")
 
-    asyncio.create_task(analytics.track_event(
+    analytics.track_event(
         "download",
         {"filename": filename, "ip_address": ip_address},
         client_id=ip_address
-    ))
+    )
+
+    return resource_assets.respond(asset, request, download=True)
+
+def postgres_result_entry(postgres_result) -> dict:
+    return {
+        "database": postgres_result.database,
+        "version": postgres_result.version,
+        "cached": False,
+        "latency_ms": postgres_result.latency_ms,
+        "plan_metrics": plan_metrics(postgres_result.plan) if postgres_result.plan else None,
+        "outputs": [
+            {
+                "content": output.content,
+                "title": output.title,
+                "latency_ms": output.latency_ms
+            }
+            for output in postgres_result.outputs
+        ]
+    }
+
+def ir_stage_outputs(ir_stages: list) -> list:
+    ir_stages_to_add = []
+    seen_titles = set()
+    for ir_stage in ir_stages:
+        normalized_name = normalize_ir_phase_name(ir_stage['stage'])
+        if normalized_name is not None:
+            title = f"IR: {normalized_name}"
+            if title not in seen_titles:
+                order = get_ir_phase_order(ir_stage['stage'])
+                ir_stages_to_add.append({
+                    "content": ir_stage["content"],
+                    "title": title,
+                    "latency_ms": None,
+                    "_order": order
+                })
+                seen_titles.add(title)
+
+    ir_stages_to_add.sort(key=lambda x: x["_order"])
+
+    for stage in ir_stages_to_add:
+        del stage["_order"]
+    return ir_stages_to_add
+
+async def execute_uncached_query(
+    query: str,
+    request_id: str,
+    request: Optional[Request],
+    emit: Optional[Callable[[str, dict], None]] = None
+):
+    # emit, when given, receives each engine's result as soon as that engine
+    # finishes, ahead of the combined result. The caller sets log_request_id.
+    fingerprint = fingerprint_query(query)
+    with measure("build_id"):
+        build_id = await get_pgx_lower_build_id()
+    with time_stage("cache_lookup"):
+        cached_ir = await get_cached_ir(fingerprint, build_id) if build_id else None
+    metrics.cache_requests.labels(cache="ir", result="miss" if cached_ir is None else "hit").inc()
+    if cached_ir is not None:
+        logger.info("IR cache hit for fingerprint: %s on build: %s", fingerprint[:16], build_id)
+
+    isolation = isolation_plan(["postgres", "pgx-lower"])
+    outcomes = {}
+
+    async def run_postgres():
+        started = time.perf_counter()
+        try:
+            postgres_result = await timed("postgres_execution", postgres_connector.run(query))
+        except Exception as e:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            metrics.engine_errors.labels(engine="postgres").inc()
+            logger.warning("PostgreSQL query failed: %s", e)
+            outcomes["postgres"] = None
+            if is_slow("postgres", elapsed_ms):
+                await record_slow_query("postgres", query, elapsed_ms, current_load(), error=str(e))
+            if emit:
+                emit("engine_error", {"database": "postgres", "error": str(e)})
+            return None
+        # Wall time for the engine alone, before any SQLite writes below
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        outcomes["postgres"] = None if postgres_result.failed else {
+            "latency_ms": postgres_result.latency_ms,
+            "rows": postgres_result.row_count,
+        }
 
-    return FileResponse(
-        file_path,
-        filename=filename
+        await log_query_execution(
+            query,
+            postgres_result.database,
+            postgres_result.latency_ms,
+            isolation_mode=isolation["mode"]
+        )
+        entry = postgres_result_entry(postgres_result)
+        if postgres_result.plan:
+            await cache_plan(
+                fingerprint, postgres_result.database, dumps(postgres_result.plan), dumps(entry["plan_metrics"])
+            )
+        if is_slow("postgres", elapsed_ms):
+            await record_slow_query(
+                "postgres", query, elapsed_ms, current_load(),
+                latency_ms=postgres_result.latency_ms,
+                row_count=postgres_result.row_count,
+                plan=postgres_result.plan
+            )
+        if emit:
+            emit("engine", entry)
+        return entry
+
+    async def run_pgx_lower():
+        started = time.perf_counter()
+        try:
+            pgx_lower_result = await timed(
+                "pgx_lower_execution",
+                execute_pgx_lower_query(query, collect_ir=cached_ir is None, warm_run=PGX_LOWER_WARM_RUN)
+            )
+        except Exception as e:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            metrics.engine_errors.labels(engine="pgx-lower").inc()
+            logger.warning("pgx-lower query failed: %s", e)
+            outcomes["pgx-lower"] = None
+            if is_slow("pgx-lower", elapsed_ms):
+                await record_slow_query("pgx-lower", query, elapsed_ms, current_load(), error=str(e))
+            if emit:
+                emit("engine_error", {"database": "pgx-lower", "error": str(e)})
+            return None
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        outcomes["pgx-lower"] = {
+            "latency_ms": pgx_lower_result.get("latency_ms", 0),
+            "rows": pgx_lower_result["query_results"].get("row_count"),
+        }
+        await log_query_execution(
+            query,
+            "pgx-lower",
+            pgx_lower_result.get("latency_ms", 0),
+            pgx_lower_result.get("breakdown"),
+            isolation_mode=isolation["mode"]
+        )
+        if is_slow("pgx-lower", elapsed_ms):
+            await record_slow_query(
+                "pgx-lower", query, elapsed_ms, current_load(),
+                latency_ms=pgx_lower_result.get("latency_ms"),
+                row_count=pgx_lower_result["query_results"].get("row_count"),
+                breakdown=pgx_lower_result.get("breakdown"),
+                ir_stages=pgx_lower_result.get("ir_stages")
+            )
+        entry = {
+            "database": "pgx-lower",
+            "version": f"PostgreSQL 17.5 with pgx-lower",
+            "cached": False,
+            "latency_ms": pgx_lower_result.get("latency_ms", 0),
+            "breakdown": pgx_lower_result.get("breakdown"),
+            "outputs": [
+                {
+                    "content": pgx_lower_result["query_results"]["content"],
+                    "title": "Query Results",
+                    "latency_ms": None
+                }
+            ]
+        }
+        if emit:
+            emit("engine", {**entry, "outputs": list(entry["outputs"])})
+
+        if cached_ir is not None:
+            ir_stages = cached_ir
+        else:
+            ir_stages = pgx_lower_result.get("ir_stages", [])
+            if ir_stages and build_id:
+                with time_stage("cache_write"):
+                    await cache_ir(fingerprint, build_id, dumps(ir_stages))
+
+        for output in ir_stage_outputs(ir_stages):
+            entry["outputs"].append(output)
+            if emit:
+                emit("ir_stage", {"database": "pgx-lower", "output": output})
+        return entry
+
+    entries = await run_until_disconnect(request, run_engines(isolation, {
+        "postgres": run_postgres,
+        "pgx-lower": run_pgx_lower,
+    }))
+    results = [entries[engine] for engine in ("postgres", "pgx-lower") if entries[engine] is not None]
+    await record_query_stats(query, outcomes)
+
+    main_display = "Query executed successfully."
+    if results:
+        main_display = f"Query executed successfully against {len(results)} database(s). Keep in mind pgx-lower is using a higher scale factor"
+
+    result = {
+        "main_display": main_display,
+        "results": results,
+        "fingerprint": fingerprint,
+        "isolation": isolation
+    }
+
+    # Serialized once; the same bytes are cached and sent as the response body
+    with time_stage("serialization"):
+        result_json = dumps(result)
+    with time_stage("cache_write"):
+        await cache_query(request_id, query, result_json)
+    logger.info(f"Query executed and cached for request_id: {request_id}")
+
+    return result_json
+
+@app.post("/query/stream")
+async def execute_query_stream(query_request: QueryRequest, request: Request):
+    # Server-sent events: "engine" per finished engine, "ir_stage" per pgx-lower
+    # IR stage, "engine_error" for a failed engine, then "done" carrying the
+    # combined (now cached) result, or "error"
+    ip_address = request.client.host if request.client else "unknown"
+
+    if len(query_request.query) > MAX_QUERY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Query too long. Maximum {MAX_QUERY_LENGTH} characters.")
+
+    request_id = hashlib.md5(query_request.query.encode()).hexdigest()
+    log_request_id.set(request_id)
+
+    await log_user_request(ip_address, request_id)
+
+    with time_stage("cache_lookup"):
+        cached_result = await get_cached_query_raw(request_id)
+    is_cached = cached_result is not None
+    metrics.cache_requests.labels(cache="response", result="hit" if is_cached else "miss").inc()
+
+    if not await check_rate_limit(ip_address, is_cached):
+        limit = MAX_CACHED_QUERIES_PER_MINUTE if is_cached else MAX_UNCACHED_QUERIES_PER_MINUTE
+        raise HTTPException(status_code=429, detail=f"Rate limit exceeded. Maximum {limit} {'cached' if is_cached else 'uncached'} queries per minute.")
+
+    logger.info("Streaming query request from %s - request_id: %s - cached: %s", ip_address, request_id, is_cached)
+
+    analytics.track_event(
+        "query_execution",
+        {"cached": is_cached, "ip_address": ip_address, "streaming": True},
+        client_id=ip_address
     )
 
-@app.get("/resources/{filename}")
-async def get_resource(filename: str):
-    file_path = RESOURCES_DIR / filename
+    async def events():
+        timings = start_request_timings()
+        yield sse_event("meta", dumps({"request_id": request_id, "cached": is_cached}))
+
+        if is_cached:
+            await record_query_stats(query_request.query, cache_hit=True)
+            yield sse_event("done", splice_result({"cached": True, "timings": timings.as_dict()}, cached_result))
+            return
+
+        updates: asyncio.Queue = asyncio.Queue()
+        execution = asyncio.ensure_future(query_coalescer.run(
+            request_id,
+            lambda: execute_uncached_query(
+                query_request.query, request_id, request,
+                emit=lambda event, payload: updates.put_nowait((event, payload))
+            ),
+            lambda: get_cached_query_raw(request_id)
+        ))
 
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Resource not found")
+        try:
+            while not execution.done() or not updates.empty():
+                if updates.empty():
+                    next_update = asyncio.ensure_future(updates.get())
+                    await asyncio.wait({next_update, execution}, return_when=asyncio.FIRST_COMPLETED)
+                    if not next_update.done():
+                        next_update.cancel()
+                        continue
+                    event, payload = next_update.result()
+                else:
+                    event, payload = updates.get_nowait()
+                yield sse_event(event, dumps(payload))
+
+            try:
+                result_json, coalesced = execution.result()
+            except Exception as e:
+                logger.error("Error processing streaming query from %s: %s", ip_address, e)
+                detail = e.detail if isinstance(e, HTTPException) else str(e)
+                yield sse_event("error", dumps({"error": detail}))
+                return
+
+            yield sse_event("done", splice_result({"cached": coalesced, "timings": timings.as_dict()}, result_json))
+        finally:
+            if not execution.done():
+                execution.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-    if not str(file_path.resolve()).startswith(str(RESOURCES_DIR.resolve())):
-        raise HTTPException(status_code=403, detail="Access denied")
+async def run_query_job(job: QueryJob) -> bool:
+    # Jobs run on one long-lived worker task, so the id is reset afterwards
+    # rather than left for whatever that task logs next
+    token = log_request_id.set(job.id)
+    try:
+        timings = start_request_timings()
+        _, coalesced = await query_coalescer.run(
+            job.id,
+            lambda: execute_uncached_query(job.query, job.id, None),
+            lambda: get_cached_query_raw(job.id)
+        )
+        job.timings = timings.as_dict()
+        return coalesced
+    finally:
+        log_request_id.reset(token)
 
-    logger.info(f"Serving resource file: {filename}")
-    return FileResponse(file_path, media_type="text/plain")
+query_jobs = QueryJobManager(run_query_job)
 
 @app.post("/query")
 async def execute_query(query_request: QueryRequest, request: Request):
@@ -192,121 +629,209 @@ async def execute_query(query_request: QueryRequest, request: Request):
         raise HTTPException(status_code=400, detail=f"Query too long. Maximum {MAX_QUERY_LENGTH} characters.")
 
     request_id = hashlib.md5(query_request.query.encode()).hexdigest()
+    log_request_id.set(request_id)
+    timings = start_request_timings()
 
     try:
-        await log_user_request(ip_address, request_id)
+        with measure("request_log"):
+            await log_user_request(ip_address, request_id)
 
-        cached_result = await get_cached_query(request_id)
+        with time_stage("cache_lookup"):
+            cached_result = await get_cached_query_raw(request_id)
         is_cached = cached_result is not None
+        metrics.cache_requests.labels(cache="response", result="hit" if is_cached else "miss").inc()
 
-        if not check_rate_limit(ip_address, is_cached):
+        if not await check_rate_limit(ip_address, is_cached):
             limit = MAX_CACHED_QUERIES_PER_MINUTE if is_cached else MAX_UNCACHED_QUERIES_PER_MINUTE
             raise HTTPException(status_code=429, detail=f"Rate limit exceeded. Maximum {limit} {'cached' if is_cached else 'uncached'} queries per minute.")
 
         logger.info(f"Query request from {ip_address} - request_id: {request_id} - cached: {is_cached}")
 
-        asyncio.create_task(analytics.track_event(
+        analytics.track_event(
             "query_execution",
             {"cached": is_cached, "ip_address": ip_address},
             client_id=ip_address
-        ))
+        )
 
         if cached_result:
             logger.info(f"Cache hit for request_id: {request_id}")
-            return {"cached": True, "result": cached_result}
+            with measure("query_stats"):
+                await record_query_stats(query_request.query, cache_hit=True)
+            return query_response(True, cached_result, timings)
 
         logger.info(f"Cache miss for request_id: {request_id}, executing query on both databases")
 
-        postgres_task = postgres_connector.run(query_request.query)
-        pgx_lower_task = execute_pgx_lower_query(query_request.query)
-
-        postgres_result, pgx_lower_result = await asyncio.gather(
-            postgres_task,
-            pgx_lower_task,
-            return_exceptions=True
+        result_json, coalesced = await query_coalescer.run(
+            request_id,
+            lambda: execute_uncached_query(query_request.query, request_id, request),
+            lambda: get_cached_query_raw(request_id)
         )
 
-        results = []
+        return query_response(coalesced, result_json, timings)
+    except Exception as e:
+        logger.error(f"Error processing query from {ip_address}: {str(e)}")
+        raise
 
-        if not isinstance(postgres_result, Exception):
-            await log_query_execution(
-                query_request.query,
-                postgres_result.database,
-                postgres_result.latency_ms
-            )
-            results.append({
-                "database": postgres_result.database,
-                "version": postgres_result.version,
-                "cached": cached_result is not None,
-                "latency_ms": postgres_result.latency_ms,
-                "outputs": [
-                    {
-                        "content": output.content,
-                        "title": output.title,
-                        "latency_ms": output.latency_ms
-                    }
-                    for output in postgres_result.outputs
-                ]
-            })
-        else:
-            logger.warning(f"PostgreSQL query failed: {str(postgres_result)}")
+JOB_POLL_SECONDS = 1.0
+JOB_EVENTS_KEEPALIVE_SECONDS = 15.0
 
-        if not isinstance(pgx_lower_result, Exception):
-            ir_outputs = [
-                {
-                    "content": pgx_lower_result["query_results"]["content"],
-                    "title": "Query Results",
-                    "latency_ms": None
-                }
-            ]
-            ir_stages_to_add = []
-            seen_titles = set()
-            for ir_stage in pgx_lower_result.get("ir_stages", []):
-                normalized_name = normalize_ir_phase_name(ir_stage['stage'])
-                if normalized_name is not None:
-                    title = f"IR: {normalized_name}"
-                    if title not in seen_titles:
-                        order = get_ir_phase_order(ir_stage['stage'])
-                        ir_stages_to_add.append({
-                            "content": ir_stage["content"],
-                            "title": title,
-                            "latency_ms": None,
-                            "_order": order
-                        })
-                        seen_titles.add(title)
-
-            ir_stages_to_add.sort(key=lambda x: x["_order"])
-
-            for stage in ir_stages_to_add:
-                del stage["_order"]
-                ir_outputs.append(stage)
-
-            results.append({
-                "database": "pgx-lower",
-                "version": f"PostgreSQL 17.5 with pgx-lower",
-                "cached": False,
-                "latency_ms": pgx_lower_result.get("latency_ms", 0),
-                "outputs": ir_outputs
-            })
-        else:
-            logger.warning(f"pgx-lower query failed: {str(pgx_lower_result)}")
+def finished_job_fields(job: Optional[QueryJob], job_id: str) -> dict:
+    if job is None:
+        return {"id": job_id, "status": "done", "cached": True}
+    return {**job.summary(), "cached": False}
 
-        main_display = "Query executed successfully."
-        if results:
-            main_display = f"Query executed successfully against {len(results)} database(s). Keep in mind pgx-lower is using a higher scale factor"
+@app.post("/jobs")
+async def submit_query_job(query_request: QueryRequest, request: Request):
+    ip_address = request.client.host if request.client else "unknown"
 
-        result = {
-            "main_display": main_display,
-            "results": results
-        }
+    if len(query_request.query) > MAX_QUERY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Query too long. Maximum {MAX_QUERY_LENGTH} characters.")
 
-        await cache_query(request_id, query_request.query, json.dumps(result))
-        logger.info(f"Query executed and cached for request_id: {request_id}")
+    job_id = hashlib.md5(query_request.query.encode()).hexdigest()
 
-        return {"cached": False, "result": result}
-    except Exception as e:
-        logger.error(f"Error processing query from {ip_address}: {str(e)}")
+    await log_user_request(ip_address, job_id)
+
+    is_cached = bool(await get_cached_request_ids([job_id]))
+
+    if not await check_rate_limit(ip_address, is_cached):
+        limit = MAX_CACHED_QUERIES_PER_MINUTE if is_cached else MAX_UNCACHED_QUERIES_PER_MINUTE
+        raise HTTPException(status_code=429, detail=f"Rate limit exceeded. Maximum {limit} {'cached' if is_cached else 'uncached'} queries per minute.")
+
+    analytics.track_event(
+        "query_job",
+        {"cached": is_cached, "ip_address": ip_address},
+        client_id=ip_address
+    )
+
+    # Relative, so it resolves correctly behind the /api proxy prefix
+    headers = {"Location": f"jobs/{job_id}"}
+
+    if is_cached:
+        await record_query_stats(query_request.query, cache_hit=True)
+        return json_response(finished_job_fields(None, job_id), headers=headers)
+
+    try:
+        job = query_jobs.submit(job_id, query_request.query)
+    except JobQueueFullError as e:
+        logger.warning("Rejected job from %s: %s", ip_address, e)
+        raise HTTPException(status_code=503, detail=str(e))
+
+    logger.info("Job request from %s - job_id: %s - status: %s", ip_address, job_id, job.status)
+    return json_response(job.summary(), status_code=202, headers=headers)
+
+@app.get("/jobs/{job_id}")
+async def get_query_job(job_id: str):
+    job = query_jobs.get(job_id)
+    if job is not None and job.status != "done":
+        return json_response(job.summary())
+
+    cached_result = await get_cached_query_raw(job_id)
+    if cached_result is not None:
+        return raw_json_response(splice_result(finished_job_fields(job, job_id), cached_result))
+
+    if job is None and await is_query_inflight(job_id):
+        # Submitted to another worker process
+        return json_response({"id": job_id, "status": "running"})
+
+    raise HTTPException(status_code=404, detail="Job not found")
+
+@app.get("/jobs/{job_id}/events")
+async def stream_query_job(job_id: str, request: Request):
+    if (
+        query_jobs.get(job_id) is None
+        and not await get_cached_request_ids([job_id])
+        and not await is_query_inflight(job_id)
+    ):
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        last_status = None
+        while not await request.is_disconnected():
+            job = query_jobs.get(job_id)
+
+            if job is not None and job.status in ACTIVE_STATUSES:
+                if job.status != last_status:
+                    last_status = job.status
+                    yield sse_event("status", dumps(job.summary()))
+                if not await query_jobs.wait_for_change(job, job.status, JOB_EVENTS_KEEPALIVE_SECONDS):
+                    yield b": keepalive\n\n"
+                continue
+
+            if job is not None and job.status == "failed":
+                yield sse_event("failed", dumps(job.summary()))
+                return
+
+            cached_result = await get_cached_query_raw(job_id)
+            if cached_result is not None:
+                yield sse_event("done", splice_result(finished_job_fields(job, job_id), cached_result))
+                return
+
+            if job is None and await is_query_inflight(job_id):
+                if last_status != "running":
+                    last_status = "running"
+                    yield sse_event("status", dumps({"id": job_id, "status": "running"}))
+                await asyncio.sleep(JOB_POLL_SECONDS)
+                continue
+
+            yield sse_event("failed", dumps({"id": job_id, "status": "failed", "error": "Job not found"}))
+            return
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # X-Accel-Buffering stops nginx from holding events back
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/query/ir")
+async def execute_query_ir(query_request: QueryRequest, request: Request):
+    ip_address = request.client.host if request.client else "unknown"
+
+    if len(query_request.query) > MAX_QUERY_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Query too long. Maximum {MAX_QUERY_LENGTH} characters.")
+
+    fingerprint = fingerprint_query(query_request.query)
+
+    try:
+        build_id = await get_pgx_lower_build_id()
+        cached_ir = await get_cached_ir(fingerprint, build_id) if build_id else None
+        is_cached = cached_ir is not None
+
+        if not await check_rate_limit(ip_address, is_cached):
+            limit = MAX_CACHED_QUERIES_PER_MINUTE if is_cached else MAX_UNCACHED_QUERIES_PER_MINUTE
+            raise HTTPException(status_code=429, detail=f"Rate limit exceeded. Maximum {limit} {'cached' if is_cached else 'uncached'} queries per minute.")
+
+        logger.info("IR request from %s - fingerprint: %s - cached: %s", ip_address, fingerprint[:16], is_cached)
+
+        if is_cached:
+            ir_stages = cached_ir
+        else:
+            pgx_lower_result = await run_until_disconnect(
+                request, execute_pgx_lower_query(query_request.query)
+            )
+            ir_stages = pgx_lower_result.get("ir_stages", [])
+            if ir_stages and build_id:
+                await cache_ir(fingerprint, build_id, dumps(ir_stages))
+
+        return json_response({
+            "query": query_request.query,
+            "fingerprint": fingerprint,
+            "build_id": build_id,
+            "cached": is_cached,
+            "num_stages": len(ir_stages),
+            "ir_stages": ir_stages
+        })
+    except ValueError as e:
+        logger.warning("Invalid IR query from %s: %s", ip_address, e)
+        raise HTTPException(status_code=400, detail=str(e))
+    except CircuitOpenError as e:
+        logger.warning("Rejected IR request from %s: %s", ip_address, e)
+        raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException:
         raise
+    except Exception as e:
+        logger.error("Error processing IR request from %s: %s", ip_address, e)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.post("/query/compare")
 async def execute_query_compare(query_request: QueryRequest, request: Request):
@@ -315,22 +840,28 @@ async def execute_query_compare(query_request: QueryRequest, request: Request):
     if len(query_request.query) > MAX_QUERY_LENGTH:
         raise HTTPException(status_code=400, detail=f"Query too long. Maximum {MAX_QUERY_LENGTH} characters.")
 
+    timings = start_request_timings()
+
     try:
         logger.info(f"Compare query request from {ip_address}: {query_request.query[:100]}...")
 
-        pgx_lower_task = execute_pgx_lower_query(query_request.query)
-        postgres_task = postgres_connector.run(query_request.query)
-
-        pgx_lower_result, postgres_result = await asyncio.gather(
-            pgx_lower_task,
-            postgres_task,
-            return_exceptions=True
-        )
+        isolation = isolation_plan(["postgres", "pgx-lower"])
+        engine_results = await run_until_disconnect(request, run_engines(isolation, {
+            "pgx-lower": lambda: capture_exception(
+                timed("pgx_lower_execution", execute_pgx_lower_query(query_request.query))
+            ),
+            "postgres": lambda: capture_exception(
+                timed("postgres_execution", postgres_connector.run(query_request.query))
+            ),
+        }))
+        pgx_lower_result = engine_results["pgx-lower"]
+        postgres_result = engine_results["postgres"]
 
         response = {
             "query": query_request.query,
             "pgx_lower": None,
             "postgres": None,
+            "isolation": isolation,
             "errors": []
         }
 
@@ -353,6 +884,7 @@ async def execute_query_compare(query_request: QueryRequest, request: Request):
                 "database": postgres_result.database,
                 "version": postgres_result.version,
                 "latency_ms": postgres_result.latency_ms,
+                "plan_metrics": plan_metrics(postgres_result.plan) if postgres_result.plan else None,
                 "outputs": [
                     {
                         "title": output.title,
@@ -365,30 +897,129 @@ async def execute_query_compare(query_request: QueryRequest, request: Request):
 
         logger.info(f"Compare query completed for {ip_address}")
 
-        asyncio.create_task(analytics.track_event(
+        analytics.track_event(
             "compare_query",
             {"ip_address": ip_address, "has_errors": len(response["errors"]) > 0},
             client_id=ip_address
-        ))
+        )
 
-        return response
+        response["timings"] = timings.as_dict()
+        return json_response(response, headers={"Server-Timing": timings.server_timing(response["timings"])})
 
     except ValueError as e:
         logger.warning(f"Invalid query from {ip_address}: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing compare query request from {ip_address}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+async def benchmark_postgres(query: str) -> dict:
+    latency_ms, row_count = await postgres_connector.run_timed(query)
+    return {"latency_ms": round(latency_ms, 3), "row_count": row_count}
+
+async def benchmark_pgx_lower(query: str) -> dict:
+    result = await execute_pgx_lower_query(query, collect_ir=False)
+    return {"latency_ms": result["latency_ms"], "row_count": result["query_results"]["row_count"]}
+
+benchmark_runner = BenchmarkRunner(benchmark_postgres, benchmark_pgx_lower)
+
+@app.post("/benchmark")
+async def run_benchmark(benchmark_request: BenchmarkRequest, request: Request):
+    ip_address = request.client.host if request.client else "unknown"
+
+    if (benchmark_request.query is None) == (benchmark_request.query_id is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of query or query_id")
+    if not 0 <= benchmark_request.warmup <= BENCHMARK_MAX_WARMUP:
+        raise HTTPException(status_code=400, detail=f"warmup must be between 0 and {BENCHMARK_MAX_WARMUP}")
+    if not 1 <= benchmark_request.iterations <= BENCHMARK_MAX_ITERATIONS:
+        raise HTTPException(status_code=400, detail=f"iterations must be between 1 and {BENCHMARK_MAX_ITERATIONS}")
+
+    if benchmark_request.query_id is not None:
+        catalog_query = query_catalog.get(benchmark_request.query_id)
+        if catalog_query is None:
+            raise HTTPException(status_code=404, detail=f"Unknown TPC-H query id: {benchmark_request.query_id}")
+        query = catalog_query.text
+        query_name = f"q{catalog_query.id:02d}"
+    else:
+        query = benchmark_request.query
+        if len(query) > MAX_QUERY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Query too long. Maximum {MAX_QUERY_LENGTH} characters.")
+        query_name = f"custom-{fingerprint_query(query)[:12]}"
+
+    if not await rate_limiters["benchmark"].check(ip_address):
+        metrics.rate_limit_rejections.labels(limiter="benchmark").inc()
+        raise HTTPException(status_code=429, detail=f"Rate limit exceeded. Maximum {MAX_BENCHMARKS_PER_MINUTE} benchmarks per minute.")
+
+    logger.info("Benchmark request from %s: %s", ip_address, query_name)
+
+    try:
+        result = await run_until_disconnect(request, benchmark_runner.run(
+            query,
+            query_name,
+            benchmark_request.warmup,
+            benchmark_request.iterations,
+            benchmark_request.label
+        ))
+    except (BenchmarkBusyError, CircuitOpenError) as e:
+        logger.warning("Rejected benchmark from %s: %s", ip_address, e)
+        raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        # Dropped or refused connections (including pgx-lower crashing
+        # mid-run) mean an engine is unavailable, not that the request was bad;
+        # checked first since some of them are also PostgresErrors
+        if is_connection_error(e):
+            logger.warning("Benchmark from %s lost its engine connection: %s: %s", ip_address, type(e).__name__, e)
+            raise HTTPException(status_code=503, detail=f"Database connection lost during benchmark: {e}")
+        if isinstance(e, (BenchmarkBudgetError, QueryTimeoutError, ValueError, asyncpg.PostgresError)):
+            logger.warning("Benchmark from %s failed: %s", ip_address, e)
+            raise HTTPException(status_code=400, detail=str(e))
+        logger.error("Error running benchmark from %s: %s", ip_address, e)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+    analytics.track_event(
+        "benchmark",
+        {"query_name": query_name, "iterations": benchmark_request.iterations, "ip_address": ip_address},
+        client_id=ip_address
+    )
+
+    return json_response(result)
+
 @app.get("/stats/performance")
 async def get_stats(limit: int = 24):
     try:
         stats = await get_performance_stats(limit=limit)
-        return {"stats": stats}
+        return json_response({"stats": stats})
     except Exception as e:
         logger.error(f"Error fetching performance stats: {str(e)}")
         raise
 
+def require_debug_key(x_debug_key: Optional[str] = Header(None)):
+    # Query text and plans are other users' SQL, so these endpoints take the
+    # same key as /debug
+    if not debug.valid_debug_key(x_debug_key):
+        raise HTTPException(status_code=403, detail="Invalid or missing X-Debug-Key")
+
+@app.get("/stats/queries", dependencies=[Depends(require_debug_key)])
+async def get_query_stats_endpoint(order: str = "total_time", limit: int = 20):
+    if order not in QUERY_STATS_ORDERS:
+        raise HTTPException(status_code=400, detail=f"order must be one of: {', '.join(QUERY_STATS_ORDERS)}")
+    limit = max(1, min(limit, 100))
+    queries = await get_query_stats(order=order, limit=limit)
+    return json_response({"order": order, "queries": queries})
+
+@app.get("/plans/{fingerprint}", dependencies=[Depends(require_debug_key)])
+async def get_plans(fingerprint: str):
+    # Latest captured plan per engine for a query fingerprint (see /query/ir),
+    # with per-node timings and derived metrics
+    plans = await get_cached_plans(fingerprint)
+    if not plans:
+        raise HTTPException(status_code=404, detail="No plans captured for this fingerprint")
+    return json_response({"fingerprint": fingerprint, "plans": plans})
+
 @app.post("/debug")
 async def debug_endpoint(debug_request: DebugRequest):
     return await debug.handle_debug_request(
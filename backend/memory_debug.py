@@ -0,0 +1,178 @@
+import asyncio
+import gc
+import os
+import sys
+import tracemalloc
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+MEMORY_TRACE_FRAMES = int(os.getenv("MEMORY_TRACE_FRAMES", "1"))
+MEMORY_SNAPSHOT_LIMIT = int(os.getenv("MEMORY_SNAPSHOT_LIMIT", "4"))
+MEMORY_TOP_LIMIT = 25
+# tracemalloc stores the depth in an unsigned short and rejects 0
+MEMORY_MAX_TRACE_FRAMES = 65535
+GROUP_BY = ("lineno", "filename", "traceback")
+
+# Allocations made by tracemalloc itself and by imports are noise in diffs
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+# Snapshots hold every traced allocation, so only the last few are kept
+_snapshots: "OrderedDict[str, tracemalloc.Snapshot]" = OrderedDict()
+
+
+def rss_kb() -> Optional[int]:
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def tracing_status() -> Dict[str, Any]:
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracing": tracemalloc.is_tracing(),
+        "frames": tracemalloc.get_traceback_limit(),
+        "traced_kb": current // 1024,
+        "traced_peak_kb": peak // 1024,
+        "overhead_kb": tracemalloc.get_tracemalloc_memory() // 1024,
+        "rss_kb": rss_kb(),
+        "snapshots": list(_snapshots),
+    }
+
+
+def start_tracing(frames: int = MEMORY_TRACE_FRAMES) -> Dict[str, Any]:
+    # More frames make tracebacks useful but multiply tracemalloc's overhead
+    if not 1 <= frames <= MEMORY_MAX_TRACE_FRAMES:
+        raise ValueError(f"frames must be between 1 and {MEMORY_MAX_TRACE_FRAMES}")
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+    return tracing_status()
+
+
+def stop_tracing() -> Dict[str, Any]:
+    tracemalloc.stop()
+    _snapshots.clear()
+    return tracing_status()
+
+
+def stat_row(stat, group_by: str) -> List[Any]:
+    # [where, size_kb, count] keeps large listings compact
+    if group_by == "traceback":
+        where = " <- ".join(f"{frame.filename}:{frame.lineno}" for frame in stat.traceback)
+    elif group_by == "filename":
+        where = stat.traceback[0].filename
+    else:
+        where = f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}"
+    return [where, round(stat.size / 1024, 1), stat.count]
+
+
+def diff_row(stat, group_by: str) -> List[Any]:
+    return stat_row(stat, group_by) + [round(stat.size_diff / 1024, 1), stat.count_diff]
+
+
+def _take_snapshot(label: str, group_by: str, limit: int) -> Dict[str, Any]:
+    snapshot = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+    _snapshots[label] = snapshot
+    _snapshots.move_to_end(label)
+    while len(_snapshots) > MEMORY_SNAPSHOT_LIMIT:
+        _snapshots.popitem(last=False)
+
+    stats = snapshot.statistics(group_by)
+    return {
+        "label": label,
+        "group_by": group_by,
+        "columns": ["where", "size_kb", "count"],
+        "top": [stat_row(stat, group_by) for stat in stats[:limit]],
+        **tracing_status(),
+    }
+
+
+async def take_snapshot(label: Optional[str] = None, group_by: str = "lineno", limit: int = MEMORY_TOP_LIMIT):
+    if not tracemalloc.is_tracing():
+        raise ValueError("tracemalloc is not running; send memory_start first")
+    if group_by not in GROUP_BY:
+        raise ValueError(f"group_by must be one of: {', '.join(GROUP_BY)}")
+    label = label or f"s{len(_snapshots) + 1}"
+    return await asyncio.to_thread(_take_snapshot, label, group_by, limit)
+
+
+def _diff(old_label: str, new_label: str, group_by: str, limit: int) -> Dict[str, Any]:
+    old, new = _snapshots[old_label], _snapshots[new_label]
+    stats = new.compare_to(old, group_by)
+    return {
+        "old": old_label,
+        "new": new_label,
+        "group_by": group_by,
+        "columns": ["where", "size_kb", "count", "size_diff_kb", "count_diff"],
+        "size_diff_kb": round(sum(stat.size_diff for stat in stats) / 1024, 1),
+        "top": [diff_row(stat, group_by) for stat in stats[:limit]],
+    }
+
+
+async def diff_snapshots(
+    old_label: Optional[str] = None,
+    new_label: Optional[str] = None,
+    group_by: str = "lineno",
+    limit: int = MEMORY_TOP_LIMIT
+):
+    # Defaults to the two most recent snapshots
+    if old_label is None or new_label is None:
+        if len(_snapshots) < 2:
+            raise ValueError("Need two snapshots to diff")
+        old_label, new_label = list(_snapshots)[-2:]
+    for label in (old_label, new_label):
+        if label not in _snapshots:
+            raise ValueError(f"No snapshot named {label}; have {', '.join(_snapshots) or 'none'}")
+    if group_by not in GROUP_BY:
+        raise ValueError(f"group_by must be one of: {', '.join(GROUP_BY)}")
+    return await asyncio.to_thread(_diff, old_label, new_label, group_by, limit)
+
+
+def _object_census(limit: int) -> Dict[str, Any]:
+    # Shallow sizes, so a dict counts its own table but not its values. The gc
+    # only tracks containers; str/bytes/int are found as their referents.
+    counts: Dict[str, int] = {}
+    sizes: Dict[str, int] = {}
+    seen = set()
+
+    def count(obj) -> None:
+        name = type(obj).__qualname__
+        counts[name] = counts.get(name, 0) + 1
+        sizes[name] = sizes.get(name, 0) + sys.getsizeof(obj, 0)
+
+    for obj in gc.get_objects():
+        count(obj)
+        for referent in gc.get_referents(obj):
+            if not gc.is_tracked(referent) and id(referent) not in seen:
+                seen.add(id(referent))
+                count(referent)
+
+    largest = sorted(sizes, key=sizes.get, reverse=True)[:limit]
+    return {
+        "columns": ["type", "size_kb", "count"],
+        "types": [[name, round(sizes[name] / 1024, 1), counts[name]] for name in largest],
+        "objects": sum(counts.values()),
+    }
+
+
+async def object_census(limit: int = MEMORY_TOP_LIMIT) -> Dict[str, Any]:
+    census = await asyncio.to_thread(_object_census, limit)
+    return {
+        **census,
+        "gc": {
+            "counts": gc.get_count(),
+            "thresholds": gc.get_threshold(),
+            "generations": gc.get_stats(),
+            "garbage": len(gc.garbage),
+        },
+        "rss_kb": rss_kb(),
+    }
@@ -0,0 +1,133 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+from request_timings import record_timing
+
+# How often each worker refreshes its live gauges
+LIVE_METRICS_INTERVAL_SECONDS = float(os.getenv("LIVE_METRICS_INTERVAL_SECONDS", "5"))
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGES = (
+    "cache_lookup",
+    "rate_limit",
+    "postgres_execution",
+    "pgx_lower_execution",
+    "ir_extraction",
+    "serialization",
+    "cache_write",
+)
+
+stage_duration = Histogram(
+    "pgx_api_stage_duration_seconds",
+    "Time spent in each /query pipeline stage",
+    ["stage"],
+    buckets=STAGE_BUCKETS
+)
+
+cache_requests = Counter(
+    "pgx_api_cache_requests_total",
+    "Result and IR cache lookups",
+    ["cache", "result"]
+)
+
+engine_errors = Counter(
+    "pgx_api_engine_errors_total",
+    "Failed engine executions",
+    ["engine"]
+)
+
+rate_limit_rejections = Counter(
+    "pgx_api_rate_limit_rejections_total",
+    "Requests rejected by the rate limiter",
+    ["limiter"]
+)
+
+# Live state (queue depth, pool usage) is refreshed by collect_live() in
+# every worker, since a scrape only reaches one of them
+queue_depth = Gauge(
+    "pgx_api_queue_depth",
+    "Items waiting in internal queues",
+    ["queue"],
+    multiprocess_mode="livesum"
+)
+
+pool_in_flight = Gauge(
+    "pgx_api_pool_in_flight",
+    "Queries in flight per backend instance",
+    ["engine", "endpoint"],
+    multiprocess_mode="livesum"
+)
+
+pool_healthy = Gauge(
+    "pgx_api_pool_healthy",
+    "Whether a backend instance is accepting traffic (1) or ejected (0)",
+    ["engine", "endpoint"],
+    multiprocess_mode="livemin"
+)
+
+loop_lag = Histogram(
+    "pgx_api_event_loop_lag_seconds",
+    "How late the event loop ran a timer scheduled at a fixed interval",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+
+loop_lag_window = Gauge(
+    "pgx_api_event_loop_lag_window_seconds",
+    "Event loop lag over the last minute",
+    ["quantile"],
+    multiprocess_mode="livemax"
+)
+
+loop_stalls = Counter(
+    "pgx_api_event_loop_stalls_total",
+    "Times a callback held the event loop longer than the block threshold"
+)
+
+_collect_hooks: list = []
+
+
+@contextmanager
+def time_stage(stage: str):
+    # Feeds both the histogram and the current request's Server-Timing breakdown
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_duration.labels(stage=stage).observe(elapsed)
+        record_timing(stage, elapsed * 1000)
+
+
+def on_collect(hook: Callable[[], None]) -> None:
+    _collect_hooks.append(hook)
+
+
+def collect_live() -> None:
+    # Runs every LIVE_METRICS_INTERVAL_SECONDS in each worker; under
+    # PROMETHEUS_MULTIPROC_DIR the other workers' live gauges would otherwise
+    # keep whatever they last wrote
+    for hook in _collect_hooks:
+        hook()
+
+
+def mark_process_dead() -> None:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+
+def render_metrics() -> tuple[bytes, str]:
+    collect_live()
+
+    # With several uvicorn workers each process writes its samples to
+    # PROMETHEUS_MULTIPROC_DIR and the scrape aggregates them
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+
+    from prometheus_client import REGISTRY
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
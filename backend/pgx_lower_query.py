@@ -1,4 +1,5 @@
 import asyncio
+from contextlib import nullcontext
 import subprocess
 import os
 import time
@@ -6,7 +7,75 @@ from typing import Dict, List, Any, Optional
 from pathlib import Path
 import asyncpg
 from ir_extractor import IRExtractor
+from ir_phase_names import IR_PHASE_CATEGORIES, get_ir_phase_category
 from logger import logger
+from metrics import time_stage
+from request_timings import measure, record_timing
+from db_connectors.base import session_timeout_settings
+from process_lock import FileLock, SHARED_STATE
+from db_connectors.resilience import CircuitBreaker, CircuitOpenError, call_with_reconnect
+
+BUILD_ID_TTL_SECONDS = 60.0
+# A failed lookup is retried sooner, but not on every query while the
+# instance is down
+BUILD_ID_MISS_TTL_SECONDS = 10.0
+EJECT_SECONDS = 30.0
+EJECT_AFTER_FAILURES = 2
+PROBE_TIMEOUT_SECONDS = 5.0
+ROUTING_STRATEGIES = ("least_loaded", "round_robin")
+# Held by every executor in local mode (use_docker_exec=False), where the
+# cleanup, run and collect steps all work on the shared IR directory
+LOCAL_IR_LOCK = asyncio.Lock()
+# Re-run each uncached /query once more to measure steady-state execution
+PGX_LOWER_WARM_RUN = os.getenv("PGX_LOWER_WARM_RUN", "false").lower() == "true"
+
+
+def compile_breakdown(
+    started_at: float,
+    finished_at: float,
+    ir_stages: List[Dict[str, Any]],
+    warm_ms: Optional[float] = None
+) -> Dict[str, Any]:
+    # pgx-lower dumps IR at the end of each compiler phase, so dump write times
+    # split the cold run into phases. Whatever follows the last dump is LLVM
+    # optimisation and machine-code JIT plus execution; only a warm rerun
+    # (cached code, no dumps) separates the two.
+    phase_ends: Dict[str, float] = {}
+    for stage in ir_stages:
+        category = get_ir_phase_category(stage["stage"])
+        written_at = stage.get("written_at")
+        if category is None or written_at is None:
+            continue
+        phase_ends[category] = max(phase_ends.get(category, 0.0), written_at)
+
+    total_ms = (finished_at - started_at) * 1000
+    breakdown: Dict[str, Any] = {"total_ms": round(total_ms, 2), "phases_ms": {}}
+
+    previous = started_at
+    for category in IR_PHASE_CATEGORIES:
+        if category not in phase_ends:
+            continue
+        end = min(max(phase_ends[category], previous), finished_at)
+        breakdown["phases_ms"][category] = round((end - previous) * 1000, 2)
+        previous = end
+
+    if breakdown["phases_ms"]:
+        breakdown["compile_ms"] = round((previous - started_at) * 1000, 2)
+        after_dumps_ms = (finished_at - previous) * 1000
+        if warm_ms is not None:
+            breakdown["jit_codegen_ms"] = round(max(after_dumps_ms - warm_ms, 0.0), 2)
+            breakdown["execute_ms"] = round(min(warm_ms, after_dumps_ms), 2)
+        else:
+            breakdown["codegen_and_execute_ms"] = round(after_dumps_ms, 2)
+    elif warm_ms is not None:
+        # Without dumps, a warm rerun is the steady-state execution estimate
+        breakdown["execute_ms"] = round(warm_ms, 2)
+        breakdown["compile_ms"] = round(max(total_ms - warm_ms, 0.0), 2)
+
+    if warm_ms is not None:
+        breakdown["warm_ms"] = round(warm_ms, 2)
+
+    return breakdown
 
 
 class PgxLowerQueryExecutor:
@@ -17,7 +86,10 @@ class PgxLowerQueryExecutor:
         user: str = "postgres",
         password: str = "",
         container_name: str = "pgx-lower-dev",
-        use_docker_exec: bool = True
+        use_docker_exec: bool = True,
+        retry_read_only: bool = False,
+        eject_after_failures: int = EJECT_AFTER_FAILURES,
+        eject_seconds: float = EJECT_SECONDS
     ):
         self.host = host
         self.port = port
@@ -26,9 +98,32 @@ class PgxLowerQueryExecutor:
         self.container_name = container_name
         self.use_docker_exec = use_docker_exec
         self.conn = None
-    
+        self._build_id: Optional[str] = None
+        self._build_id_checked_at: Optional[float] = None
+        # IR files are written to one directory per instance, so queries on
+        # the same instance must not overlap. In local mode every instance
+        # dumps into the one IRExtractor.IR_TEMP_DIR, so they all share a lock.
+        self.lock = asyncio.Lock() if use_docker_exec else LOCAL_IR_LOCK
+        # With several API workers the instance is also locked across processes
+        lock_name = f"pgx-lower-{self.container_name}-{self.endpoint}" if use_docker_exec else "pgx-lower-local-ir"
+        self.instance_lock = FileLock(lock_name) if SHARED_STATE else None
+        self.in_flight = 0
+        # Set once the query itself has gone to the server, so a crash it
+        # caused is not replayed unless retry_read_only asks for that
+        self.query_sent = False
+        self.retry_read_only = retry_read_only
+        self.breaker = CircuitBreaker(
+            f"pgx-lower at {self.endpoint}",
+            failure_threshold=eject_after_failures,
+            reset_timeout=eject_seconds
+        )
+
+    @property
+    def endpoint(self) -> str:
+        return f"{self.host}:{self.port}"
+
     async def connect(self) -> None:
-        if self.conn:
+        if self.conn and not self.conn.is_closed():
             return
 
         self.conn = await asyncpg.connect(
@@ -37,7 +132,8 @@ class PgxLowerQueryExecutor:
             user=self.user,
             password=self.password,
             database="postgres",
-            timeout=10
+            timeout=10,
+            server_settings=session_timeout_settings("PGX_LOWER")
         )
         logger.info(f"Connected to pgx-lower at {self.host}:{self.port}")
 
@@ -45,9 +141,102 @@ class PgxLowerQueryExecutor:
         if self.conn:
             await self.conn.close()
             self.conn = None
-            logger.info("Disconnected from pgx-lower")
-    
-    def _get_ir_files_from_container(self) -> List[tuple[str, str]]:
+            logger.info("Disconnected from pgx-lower at %s", self.endpoint)
+
+    def discard_connection(self) -> None:
+        if self.conn:
+            self.conn.terminate()
+            self.conn = None
+
+    async def probe(self, timeout: float = PROBE_TIMEOUT_SECONDS) -> bool:
+        try:
+            async with self.lock, self.instance_lock or nullcontext():
+                await call_with_reconnect(
+                    lambda: asyncio.wait_for(self._probe(), timeout=timeout),
+                    self.discard_connection,
+                    self.breaker
+                )
+            return True
+        except Exception as e:
+            logger.debug("pgx-lower probe failed for %s: %s", self.endpoint, e)
+            return False
+
+    async def _probe(self) -> None:
+        await self.connect()
+        await self.conn.fetchval("SELECT 1")
+
+    def _inspect_container_image(self) -> Optional[str]:
+        try:
+            result = subprocess.run(
+                ["/usr/bin/docker", "inspect", "--format", "{{.Image}}", self.container_name],
+                capture_output=True,
+                text=True,
+                timeout=5
+            )
+        except Exception as e:
+            logger.warning("Failed to inspect pgx-lower container image: %s", e)
+            return None
+
+        if result.returncode != 0:
+            return None
+
+        return result.stdout.strip() or None
+
+    async def _server_build(self) -> Optional[str]:
+        # The installed pgx_lower.so changes on every rebuild or re-pull, so
+        # its size and mtime identify the build the server will actually load.
+        # A short-lived connection keeps this off the instance lock.
+        try:
+            conn = await asyncpg.connect(
+                host=self.host,
+                port=self.port,
+                user=self.user,
+                password=self.password,
+                database="postgres",
+                timeout=PROBE_TIMEOUT_SECONDS
+            )
+        except Exception as e:
+            logger.warning("Failed to connect to pgx-lower at %s for its build id: %s", self.endpoint, e)
+            return None
+
+        try:
+            row = await conn.fetchrow("""
+                SELECT current_setting('server_version') AS version, f.size, f.modification
+                FROM pg_config c
+                LEFT JOIN LATERAL pg_stat_file(c.setting || '/pgx_lower.so', true) f ON true
+                WHERE c.name = 'PKGLIBDIR'
+            """)
+        except Exception as e:
+            logger.warning("Failed to read pgx-lower build from %s: %s", self.endpoint, e)
+            return None
+        finally:
+            await conn.close()
+
+        if row is None or row["size"] is None:
+            return None
+        return f"pg{row['version']}:{row['size']}@{row['modification'].timestamp():.0f}"
+
+    async def get_build_id(self) -> Optional[str]:
+        now = time.monotonic()
+        ttl = BUILD_ID_TTL_SECONDS if self._build_id else BUILD_ID_MISS_TTL_SECONDS
+        if self._build_id_checked_at is not None and now - self._build_id_checked_at < ttl:
+            return self._build_id
+
+        build_id = await self._server_build()
+        if not build_id and self.use_docker_exec:
+            # The image digest changes whenever the tag is re-pulled
+            build_id = await asyncio.to_thread(self._inspect_container_image)
+
+        # An unknown build is cached too; callers skip the IR cache until it
+        # can be read
+        if build_id and build_id != self._build_id:
+            logger.info("pgx-lower build id: %s", build_id)
+
+        self._build_id = build_id
+        self._build_id_checked_at = now
+        return build_id
+
+    def _get_ir_files_from_container(self) -> List[tuple[str, str, Optional[float]]]:
         if not self.use_docker_exec:
             return []
 
@@ -55,7 +244,7 @@ class PgxLowerQueryExecutor:
         try:
             result = subprocess.run(
                 ["/usr/bin/docker", "exec", self.container_name, "find", "/tmp/pgx_ir",
-                 "-name", "pgx_lower_*.mlir", "-type", "f"],
+                 "-name", "pgx_lower_*.mlir", "-type", "f", "-printf", "%T@ %p\\n"],
                 capture_output=True,
                 text=True,
                 timeout=5
@@ -64,9 +253,10 @@ class PgxLowerQueryExecutor:
             if result.returncode != 0:
                 return []
 
-            filepaths = [fp.strip() for fp in result.stdout.strip().split("\n") if fp.strip()]
+            # Each line is "<mtime with fractional seconds> <path>"
+            listed = [line.strip().split(" ", 1) for line in result.stdout.strip().split("\n") if line.strip()]
 
-            for filepath in filepaths:
+            for written_at, filepath in listed:
                 result = subprocess.run(
                     ["/usr/bin/docker", "exec", self.container_name, "cat", filepath],
                     capture_output=True,
@@ -76,7 +266,7 @@ class PgxLowerQueryExecutor:
 
                 if result.returncode == 0:
                     filename = filepath.split("/")[-1]
-                    ir_files.append((filename, result.stdout))
+                    ir_files.append((filename, result.stdout, float(written_at)))
         except Exception as e:
             logger.warning(f"Failed to extract IR files from container: {e}")
 
@@ -85,9 +275,37 @@ class PgxLowerQueryExecutor:
     async def execute(
         self,
         query: str,
-        database: str = "postgres"
+        database: str = "postgres",
+        collect_ir: bool = True,
+        warm_run: bool = False
+    ) -> Dict[str, Any]:
+        self.in_flight += 1
+        try:
+            queued_at = time.perf_counter()
+            async with self.lock, self.instance_lock or nullcontext():
+                record_timing("pgx_lower.queue", (time.perf_counter() - queued_at) * 1000)
+                # Failures before the query was sent (connect, stale session,
+                # LOAD/SET) are always retried. Write operations are rejected
+                # inside _execute, so a retry after sending replays a read-only query.
+                return await call_with_reconnect(
+                    lambda: self._execute(query, database, collect_ir, warm_run),
+                    self.discard_connection,
+                    self.breaker,
+                    retry=self.retry_read_only,
+                    retry_if=lambda error: not self.query_sent
+                )
+        finally:
+            self.in_flight -= 1
+
+    async def _execute(
+        self,
+        query: str,
+        database: str,
+        collect_ir: bool,
+        warm_run: bool = False
     ) -> Dict[str, Any]:
-        if not self.conn:
+        self.query_sent = False
+        with measure("pgx_lower.connect"):
             await self.connect()
 
         query_upper = query.strip().upper()
@@ -95,10 +313,11 @@ class PgxLowerQueryExecutor:
             raise ValueError("Query contains write operations - only SELECT queries are allowed")
 
         IRExtractor.ensure_ir_directory()
-        removed = IRExtractor.cleanup_all_ir_files()
-        logger.debug(f"Cleaned {removed} old IR files")
+        with measure("pgx_lower.ir_cleanup"):
+            removed = await IRExtractor.cleanup_all_ir_files_async()
+        logger.debug("Cleaned %d old IR files", removed)
 
-        start_time = time.time()
+        setup_start = time.perf_counter()
 
         try:
             try:
@@ -108,75 +327,270 @@ class PgxLowerQueryExecutor:
                     logger.warning(f"Failed to load extension: {e}")
 
             try:
-                await self.conn.execute("SET pgx_lower.log_enable = true")
-                await self.conn.execute(
-                    "SET pgx_lower.enabled_categories = 'AST_TRANSLATE,RELALG_LOWER,DB_LOWER,JIT'"
-                )
+                if collect_ir:
+                    await self.conn.execute("SET pgx_lower.log_enable = true")
+                    await self.conn.execute(
+                        "SET pgx_lower.enabled_categories = 'AST_TRANSLATE,RELALG_LOWER,DB_LOWER,JIT'"
+                    )
+                else:
+                    await self.conn.execute("SET pgx_lower.log_enable = false")
             except asyncpg.PostgresError:
                 logger.debug("Could not set pgx_lower logging parameters")
 
-            logger.debug(f"Executing query: {query[:100]}...")
-            results = await self.conn.fetch(query)
-
-            elapsed_ms = int((time.time() - start_time) * 1000)
-
-            query_content = "No results"
-            if results:
-                columns = list(results[0].keys())
-                lines = [" | ".join(str(c) for c in columns)]
-                lines.append("-" * len(lines[0]))
-                for row in results:
-                    lines.append(" | ".join(str(row[c]) for c in columns))
-                query_content = "\n".join(lines)
-
-            await asyncio.sleep(0.1)
+            record_timing("pgx_lower.setup", (time.perf_counter() - setup_start) * 1000)
 
-            if self.use_docker_exec:
-                ir_files = self._get_ir_files_from_container()
+            # latency_ms covers the query itself, matching the PostgreSQL
+            # connector; LOAD/SET overhead is reported separately as setup
+            logger.debug("Executing query: %.100s...", query)
+            started_at = time.time()
+            start_time = time.perf_counter()
+            self.query_sent = True
+            results = await self.conn.fetch(query)
+            fetch_ms = (time.perf_counter() - start_time) * 1000
+            finished_at = started_at + fetch_ms / 1000
+            record_timing("pgx_lower.fetch", fetch_ms)
+            elapsed_ms = round(fetch_ms, 2)
+
+            with measure("pgx_lower.format"):
+                query_content = "No results"
+                if results:
+                    columns = list(results[0].keys())
+                    lines = [" | ".join(str(c) for c in columns)]
+                    lines.append("-" * len(lines[0]))
+                    for row in results:
+                        lines.append(" | ".join(str(row[c]) for c in columns))
+                    query_content = "\n".join(lines)
+
+            if not collect_ir:
+                ir_stages = []
+            elif self.use_docker_exec:
+                await asyncio.sleep(0.1)
+                with time_stage("ir_extraction"):
+                    ir_files = self._get_ir_files_from_container()
                 ir_stages = [
                     {
                         "stage": IRExtractor.parse_ir_stage_name(filename),
                         "filename": filename,
-                        "content": content
+                        "content": content,
+                        "written_at": written_at
                     }
-                    for filename, content in ir_files
+                    for filename, content, written_at in ir_files
                 ]
             else:
-                ir_stages = IRExtractor.extract_ir_stages()
+                await asyncio.sleep(0.1)
+                with time_stage("ir_extraction"):
+                    ir_stages = await IRExtractor.extract_ir_stages_async()
 
             logger.info(f"Query executed successfully, {len(ir_stages)} IR stages generated")
 
+            warm_ms = None
+            if warm_run:
+                # Second run without IR dumps, so nothing but the query is timed
+                try:
+                    await self.conn.execute("SET pgx_lower.log_enable = false")
+                except asyncpg.PostgresError:
+                    logger.debug("Could not disable pgx_lower logging for warm run")
+                warm_start = time.perf_counter()
+                await self.conn.fetch(query)
+                warm_ms = (time.perf_counter() - warm_start) * 1000
+                record_timing("pgx_lower.warm_fetch", warm_ms)
+
             return {
                 "query": query,
                 "database": database,
+                "endpoint": self.endpoint,
                 "latency_ms": elapsed_ms,
                 "query_results": {
                     "title": "Query Results",
                     "content": query_content,
                     "row_count": len(results) if results else 0
                 },
-                "ir_stages": ir_stages
+                "ir_stages": ir_stages,
+                "breakdown": compile_breakdown(started_at, finished_at, ir_stages, warm_ms)
             }
 
         finally:
-            removed = IRExtractor.cleanup_all_ir_files()
-            logger.debug(f"Cleaned up {removed} IR files")
+            removed = await IRExtractor.cleanup_all_ir_files_async()
+            logger.debug("Cleaned up %d IR files", removed)
 
 
-_executor: Optional[PgxLowerQueryExecutor] = None
+class PgxLowerExecutorPool:
+    def __init__(
+        self,
+        executors: List[PgxLowerQueryExecutor],
+        strategy: str = "least_loaded"
+    ):
+        if not executors:
+            raise ValueError("At least one pgx-lower endpoint is required")
+        if strategy not in ROUTING_STRATEGIES:
+            raise ValueError(f"Unknown routing strategy: {strategy}")
+
+        self.executors = executors
+        self.strategy = strategy
+        self._next_index = 0
+        self._pinned: Dict[str, PgxLowerQueryExecutor] = {}
+
+    async def _reprobe_ejected(self) -> None:
+        # An ejected instance is one whose circuit is open; once the ejection
+        # window passes it gets a SELECT 1 trial before taking real traffic
+        pending = [
+            executor for executor in self.executors
+            if executor.breaker.state == "half_open" and executor.breaker.allows_request()
+        ]
+        if not pending:
+            return
 
+        probes = await asyncio.gather(*(executor.probe() for executor in pending))
+        for executor, ok in zip(pending, probes):
+            if ok:
+                logger.info("pgx-lower instance %s passed re-probe, re-admitted", executor.endpoint)
 
-async def get_executor() -> PgxLowerQueryExecutor:
+    def _choose(self, candidates: List[PgxLowerQueryExecutor]) -> PgxLowerQueryExecutor:
+        start = self._next_index % len(candidates)
+        self._next_index += 1
+        rotated = candidates[start:] + candidates[:start]
+
+        if self.strategy == "round_robin":
+            return rotated[0]
+
+        return min(rotated, key=lambda executor: executor.in_flight)
+
+    def _healthy(self) -> List[PgxLowerQueryExecutor]:
+        return [executor for executor in self.executors if executor.breaker.state == "closed"]
+
+    async def acquire(self) -> PgxLowerQueryExecutor:
+        await self._reprobe_ejected()
+
+        candidates = self._healthy()
+        if not candidates:
+            raise CircuitOpenError(
+                "pgx-lower is currently unavailable (all instances failing), please try again shortly"
+            )
+
+        return self._choose(candidates)
+
+    def pinned(self, host: Optional[str], port: Optional[int]) -> PgxLowerQueryExecutor:
+        template = self.executors[0]
+        host = host or template.host
+        port = port or template.port
+
+        for executor in self.executors:
+            if executor.host == host and executor.port == port:
+                return executor
+
+        key = f"{host}:{port}"
+        if key not in self._pinned:
+            self._pinned[key] = PgxLowerQueryExecutor(
+                host=host,
+                port=port,
+                user=template.user,
+                password=template.password,
+                container_name=template.container_name,
+                use_docker_exec=template.use_docker_exec,
+                retry_read_only=template.retry_read_only,
+                eject_after_failures=template.breaker.failure_threshold,
+                eject_seconds=template.breaker.reset_timeout
+            )
+        return self._pinned[key]
+
+    async def execute(
+        self,
+        query: str,
+        database: str = "postgres",
+        collect_ir: bool = True,
+        warm_run: bool = False
+    ) -> Dict[str, Any]:
+        executor = await self.acquire()
+        return await executor.execute(query, database, collect_ir=collect_ir, warm_run=warm_run)
+
+    async def get_build_id(self) -> Optional[str]:
+        # Ejected instances take no traffic, so they are not asked either;
+        # with none healthy the query fails in acquire() anyway
+        candidates = self._healthy()
+        if not candidates:
+            return None
+        build_ids = await asyncio.gather(*(executor.get_build_id() for executor in candidates))
+        if None in build_ids:
+            return None
+        # Mixed builds behind one pool get a combined id so no single build's IR is served for another
+        return "+".join(sorted(set(build_ids)))
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "endpoint": executor.endpoint,
+                "container": executor.container_name,
+                "healthy": executor.breaker.state == "closed",
+                "circuit": executor.breaker.snapshot(),
+                "in_flight": executor.in_flight,
+                "connected": executor.conn is not None
+            }
+            for executor in self.executors
+        ]
+
+    async def disconnect(self) -> None:
+        for executor in self.executors + list(self._pinned.values()):
+            try:
+                await executor.disconnect()
+            except Exception as e:
+                logger.warning("Error disconnecting pgx-lower instance %s: %s", executor.endpoint, e)
+        self._pinned.clear()
+
+
+def parse_endpoints(value: str, default_container: str) -> List[tuple[str, int, str]]:
+    endpoints = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+
+        address, _, container = item.partition("@")
+        host, _, port = address.rpartition(":")
+        if not host:
+            raise ValueError(f"Invalid pgx-lower endpoint '{item}', expected host:port[@container]")
+
+        endpoints.append((host, int(port), container or default_container))
+
+    return endpoints
+
+
+_executor: Optional[PgxLowerExecutorPool] = None
+
+
+async def get_executor() -> PgxLowerExecutorPool:
     global _executor
 
     if _executor is None:
-        _executor = PgxLowerQueryExecutor(
-            host=os.getenv("PGX_LOWER_HOST", "localhost"),
-            port=int(os.getenv("PGX_LOWER_PORT", "54320")),
-            user=os.getenv("PGX_LOWER_USER", "postgres"),
-            password=os.getenv("PGX_LOWER_PASSWORD", ""),
-            container_name=os.getenv("PGX_LOWER_CONTAINER", "pgx-lower-dev"),
-            use_docker_exec=os.getenv("USE_DOCKER_EXEC", "true").lower() == "true"
+        default_container = os.getenv("PGX_LOWER_CONTAINER", "pgx-lower-dev")
+        endpoints = parse_endpoints(os.getenv("PGX_LOWER_ENDPOINTS", ""), default_container)
+        if not endpoints:
+            endpoints = [(
+                os.getenv("PGX_LOWER_HOST", "localhost"),
+                int(os.getenv("PGX_LOWER_PORT", "54320")),
+                default_container
+            )]
+
+        executors = [
+            PgxLowerQueryExecutor(
+                host=host,
+                port=port,
+                user=os.getenv("PGX_LOWER_USER", "postgres"),
+                password=os.getenv("PGX_LOWER_PASSWORD", ""),
+                container_name=container_name,
+                use_docker_exec=os.getenv("USE_DOCKER_EXEC", "true").lower() == "true",
+                retry_read_only=os.getenv("PGX_LOWER_RETRY_READONLY", "false").lower() == "true",
+                eject_after_failures=int(os.getenv("PGX_LOWER_EJECT_AFTER_FAILURES", str(EJECT_AFTER_FAILURES))),
+                eject_seconds=float(os.getenv("PGX_LOWER_EJECT_SECONDS", str(EJECT_SECONDS)))
+            )
+            for host, port, container_name in endpoints
+        ]
+
+        _executor = PgxLowerExecutorPool(
+            executors,
+            strategy=os.getenv("PGX_LOWER_ROUTING", "least_loaded")
+        )
+        logger.info(
+            "pgx-lower pool: %s (%s)", ', '.join(e.endpoint for e in executors), _executor.strategy
         )
 
     return _executor
@@ -186,16 +600,26 @@ async def execute_pgx_lower_query(
     query: str,
     database: str = "postgres",
     host: Optional[str] = None,
-    port: Optional[int] = None
+    port: Optional[int] = None,
+    collect_ir: bool = True,
+    warm_run: bool = False
 ) -> Dict[str, Any]:
+    pool = await get_executor()
+
+    if host or port:
+        executor = pool.pinned(host, port)
+        return await executor.execute(query, database, collect_ir=collect_ir, warm_run=warm_run)
+
+    return await pool.execute(query, database, collect_ir=collect_ir, warm_run=warm_run)
+
+
+async def get_pgx_lower_build_id() -> Optional[str]:
     executor = await get_executor()
+    return await executor.get_build_id()
 
-    if host:
-        executor.host = host
-    if port:
-        executor.port = port
 
-    return await executor.execute(query, database)
+def get_executor_status() -> List[Dict[str, Any]]:
+    return _executor.status() if _executor else []
 
 
 async def shutdown_executor() -> None:
@@ -0,0 +1,311 @@
+import statistics
+from typing import Any, Dict, List, Optional, Union
+import orjson
+
+PLAN_TOP_NODES = 5
+
+BUFFER_KEYS = {
+    "Shared Hit Blocks": "shared_hit",
+    "Shared Read Blocks": "shared_read",
+    "Shared Dirtied Blocks": "shared_dirtied",
+    "Shared Written Blocks": "shared_written",
+    "Local Hit Blocks": "local_hit",
+    "Local Read Blocks": "local_read",
+    "Temp Read Blocks": "temp_read",
+    "Temp Written Blocks": "temp_written",
+}
+
+# Node details shown under each operator in the rendered text plan, in the
+# order EXPLAIN's own text format uses. Sort Method, Hash Buckets, HashAgg
+# Batches, Exact Heap Blocks and Cache Hits each start a combined line.
+DETAIL_KEYS = (
+    "Output", "Group Key", "Sort Key", "Presorted Key", "Sort Method", "Hash Cond", "Merge Cond",
+    "Join Filter", "Rows Removed by Join Filter", "Index Cond", "Recheck Cond",
+    "Rows Removed by Index Recheck", "One-Time Filter", "Filter", "Rows Removed by Filter",
+    "Cache Key", "Cache Mode", "Cache Hits", "HashAgg Batches", "Hash Buckets", "Exact Heap Blocks",
+    "Heap Fetches", "Workers Planned", "Workers Launched",
+)
+
+# Only read as part of the combined lines above
+COMBINED_DETAIL_KEYS = (
+    "Sort Space Used", "Sort Space Type", "Original Hash Buckets", "Hash Batches",
+    "Original Hash Batches", "Peak Memory Usage", "Disk Usage", "Lossy Heap Blocks",
+    "Cache Misses", "Cache Evictions", "Cache Overflows",
+)
+
+AGGREGATE_LABELS = {
+    "Plain": "Aggregate",
+    "Sorted": "GroupAggregate",
+    "Hashed": "HashAggregate",
+    "Mixed": "MixedAggregate",
+}
+
+PARALLEL_NODE_TYPES = ("Gather", "Gather Merge")
+
+
+def load_explain(value: Union[str, bytes, list]) -> Dict[str, Any]:
+    # EXPLAIN (FORMAT JSON) returns a single row holding a one-element array
+    document = orjson.loads(value) if isinstance(value, (str, bytes)) else value
+    return document[0] if isinstance(document, list) else document
+
+
+def q_error(plan_rows: Optional[float], actual_rows: Optional[float]) -> Optional[float]:
+    # Symmetric estimate error: 1 is exact, 10 is off by 10x in either direction
+    if plan_rows is None or actual_rows is None:
+        return None
+    estimated = max(plan_rows, 1.0)
+    actual = max(actual_rows, 1.0)
+    return round(max(estimated / actual, actual / estimated), 2)
+
+
+def parse_node(raw: Dict[str, Any], parallel_workers: int = 1) -> Dict[str, Any]:
+    loops = raw.get("Actual Loops")
+    per_loop_ms = raw.get("Actual Total Time")
+    actual_rows = raw.get("Actual Rows")
+
+    # Times are averaged per loop; under a Gather the loops run side by side
+    # in workers, so dividing by the worker count gives wall time
+    inclusive_ms = None
+    if per_loop_ms is not None and loops:
+        inclusive_ms = per_loop_ms * loops / parallel_workers
+
+    if raw.get("Node Type") in PARALLEL_NODE_TYPES:
+        parallel_workers = raw.get("Workers Launched", raw.get("Workers Planned", 0)) + 1
+
+    children = [parse_node(child, parallel_workers) for child in raw.get("Plans", [])]
+
+    exclusive_ms = None
+    if inclusive_ms is not None:
+        child_ms = sum(child["inclusive_ms"] or 0.0 for child in children)
+        exclusive_ms = max(inclusive_ms - child_ms, 0.0)
+
+    buffers = {name: raw[key] for key, name in BUFFER_KEYS.items() if raw.get(key)}
+
+    return {
+        "node_type": raw.get("Node Type"),
+        "relation": raw.get("Relation Name"),
+        "alias": raw.get("Alias"),
+        "index": raw.get("Index Name"),
+        "join_type": raw.get("Join Type"),
+        "strategy": raw.get("Strategy"),
+        "partial_mode": raw.get("Partial Mode"),
+        "command": raw.get("Command"),
+        "parallel_aware": raw.get("Parallel Aware", False),
+        "async_capable": raw.get("Async Capable", False),
+        "scan_direction": raw.get("Scan Direction"),
+        "cte_name": raw.get("CTE Name"),
+        "function_name": raw.get("Function Name"),
+        "subplan_name": raw.get("Subplan Name"),
+        "parent_relationship": raw.get("Parent Relationship"),
+        "startup_cost": raw.get("Startup Cost"),
+        "total_cost": raw.get("Total Cost"),
+        "plan_rows": raw.get("Plan Rows"),
+        "plan_width": raw.get("Plan Width"),
+        "actual_startup_ms": raw.get("Actual Startup Time"),
+        "actual_total_ms": per_loop_ms,
+        "actual_rows": actual_rows,
+        "loops": loops,
+        "inclusive_ms": round(inclusive_ms, 3) if inclusive_ms is not None else None,
+        "exclusive_ms": round(exclusive_ms, 3) if exclusive_ms is not None else None,
+        "row_error": q_error(raw.get("Plan Rows"), actual_rows),
+        "buffers": buffers,
+        "details": {key: raw[key] for key in DETAIL_KEYS + COMBINED_DETAIL_KEYS if key in raw},
+        "children": children,
+    }
+
+
+def parse_plan(explain: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "planning_ms": explain.get("Planning Time"),
+        "execution_ms": explain.get("Execution Time"),
+        "analyzed": "Actual Loops" in explain["Plan"],
+        "root": parse_node(explain["Plan"]),
+    }
+
+
+def walk(node: Dict[str, Any]):
+    yield node
+    for child in node["children"]:
+        yield from walk(child)
+
+
+def node_label(node: Dict[str, Any]) -> str:
+    # Built the way explain.c names a node in text format. Plans cached
+    # before these fields were parsed lack them, hence .get()
+    label = node["node_type"]
+    if label == "Aggregate":
+        label = AGGREGATE_LABELS.get(node.get("strategy"), label)
+        if node.get("partial_mode") in ("Partial", "Finalize"):
+            label = f"{node['partial_mode']} {label}"
+    elif label == "SetOp":
+        if node.get("strategy") == "Hashed":
+            label = "HashSetOp"
+        if node.get("command"):
+            label = f"{label} {node['command']}"
+    if node.get("async_capable"):
+        label = f"Async {label}"
+    if node.get("parallel_aware"):
+        label = f"Parallel {label}"
+
+    join_type = node["join_type"]
+    if join_type and join_type != "Inner":
+        if label.endswith(" Join"):
+            label = f"{label[:-5]} {join_type} Join"
+        elif label == "Nested Loop":
+            label = f"{label} {join_type} Join"
+    if node.get("scan_direction") == "Backward":
+        label = f"{label} Backward"
+    if node["index"]:
+        label = f"{label} using {node['index']}"
+
+    target = node["relation"] or node.get("cte_name") or node.get("function_name")
+    alias = node["alias"]
+    if target:
+        label = f"{label} on {target}" + (f" {alias}" if alias and alias != target else "")
+    elif alias and node["node_type"] == "Subquery Scan":
+        label = f"{label} on {alias}"
+    return label
+
+
+def plan_metrics(plan: Dict[str, Any], top: int = PLAN_TOP_NODES) -> Dict[str, Any]:
+    nodes = list(walk(plan["root"]))
+    metrics: Dict[str, Any] = {
+        "planning_ms": plan["planning_ms"],
+        "execution_ms": plan["execution_ms"],
+        "node_count": len(nodes),
+    }
+    if not plan["analyzed"]:
+        return metrics
+
+    total_ms = sum(node["exclusive_ms"] or 0.0 for node in nodes)
+
+    # Where the time went, by operator type; this is what lines up against
+    # pgx-lower's latency for the same fingerprint
+    operator_ms: Dict[str, float] = {}
+    for node in nodes:
+        operator_ms[node["node_type"]] = operator_ms.get(node["node_type"], 0.0) + (node["exclusive_ms"] or 0.0)
+
+    by_time = sorted(nodes, key=lambda node: node["exclusive_ms"] or 0.0, reverse=True)[:top]
+    metrics["top_nodes"] = [
+        {
+            "node": node_label(node),
+            "exclusive_ms": node["exclusive_ms"],
+            "share": round(node["exclusive_ms"] / total_ms, 4) if total_ms else None,
+            "actual_rows": node["actual_rows"],
+            "loops": node["loops"],
+        }
+        for node in by_time
+    ]
+    metrics["operator_ms"] = {
+        name: round(ms, 3) for name, ms in sorted(operator_ms.items(), key=lambda item: item[1], reverse=True)
+    }
+
+    errors = [node for node in nodes if node["row_error"] is not None]
+    if errors:
+        worst = sorted(errors, key=lambda node: node["row_error"], reverse=True)[:top]
+        metrics["row_error"] = {
+            "max": worst[0]["row_error"],
+            "median": round(statistics.median(node["row_error"] for node in errors), 2),
+            "worst": [
+                {
+                    "node": node_label(node),
+                    "plan_rows": node["plan_rows"],
+                    "actual_rows": node["actual_rows"],
+                    "row_error": node["row_error"],
+                }
+                for node in worst
+            ],
+        }
+
+    # Buffer counts include children, so the root holds the plan's totals
+    metrics["buffers"] = plan["root"]["buffers"]
+    return metrics
+
+
+def format_detail(value: Any) -> str:
+    return ", ".join(str(item) for item in value) if isinstance(value, list) else str(value)
+
+
+def originally(details: Dict[str, Any], key: str) -> str:
+    value = details[key]
+    original = details.get(f"Original {key}", value)
+    return f"{value} (originally {original})" if original != value else str(value)
+
+
+def detail_lines(details: Dict[str, Any]) -> List[str]:
+    lines = []
+    for key in DETAIL_KEYS:
+        if key not in details:
+            continue
+        value = details[key]
+        if key == "Sort Method":
+            line = f"Sort Method: {value}"
+            if "Sort Space Used" in details:
+                line += f"  {details.get('Sort Space Type', 'Memory')}: {details['Sort Space Used']}kB"
+        elif key == "Hash Buckets":
+            line = f"Buckets: {originally(details, 'Hash Buckets')}  Batches: {originally(details, 'Hash Batches')}"
+            if "Peak Memory Usage" in details:
+                line += f"  Memory Usage: {details['Peak Memory Usage']}kB"
+        elif key == "HashAgg Batches":
+            line = f"Batches: {value}  Memory Usage: {details.get('Peak Memory Usage', 0)}kB"
+            if value > 1 and "Disk Usage" in details:
+                line += f"  Disk Usage: {details['Disk Usage']}kB"
+        elif key == "Exact Heap Blocks":
+            blocks = [f"{kind}={details[name]}" for kind, name in (("exact", key), ("lossy", "Lossy Heap Blocks"))
+                      if details.get(name)]
+            if not blocks:
+                continue
+            line = f"Heap Blocks: {' '.join(blocks)}"
+        elif key == "Cache Hits":
+            line = "  ".join(
+                f"{name}: {details.get(f'Cache {name}', 0)}" for name in ("Hits", "Misses", "Evictions", "Overflows")
+            )
+            if "Peak Memory Usage" in details:
+                line += f"  Memory Usage: {details['Peak Memory Usage']}kB"
+        else:
+            line = f"{key}: {format_detail(value)}"
+        lines.append(line)
+    return lines
+
+
+def render_plan(plan: Dict[str, Any]) -> str:
+    # Text rendering close to EXPLAIN's own format, for display
+    lines: List[str] = []
+
+    def render(node: Dict[str, Any], depth: int, shift: int = 0) -> None:
+        indent = " " * (6 * depth - 4 + shift) if depth else ""
+        # InitPlans, SubPlans and CTEs get a header line, with the node under it
+        if depth and node.get("subplan_name"):
+            lines.append(f"{indent}{node['subplan_name']}")
+            indent += "  "
+            shift += 2
+        prefix = f"{indent}->  " if depth else ""
+        line = f"{prefix}{node_label(node)}  (cost={node['startup_cost']:.2f}..{node['total_cost']:.2f} " \
+               f"rows={node['plan_rows']} width={node['plan_width']})"
+        if node["loops"] is not None:
+            if node["loops"]:
+                line += f" (actual time={node['actual_startup_ms']:.3f}..{node['actual_total_ms']:.3f} " \
+                        f"rows={node['actual_rows']} loops={node['loops']})"
+            else:
+                line += " (never executed)"
+        lines.append(line)
+
+        detail_indent = indent + ("      " if depth else "  ")
+        for detail in detail_lines(node["details"]):
+            lines.append(f"{detail_indent}{detail}")
+        if node["buffers"]:
+            parts = " ".join(
+                f"{name.split('_')[1]}={blocks}" for name, blocks in node["buffers"].items() if name.startswith("shared")
+            )
+            if parts:
+                lines.append(f"{detail_indent}Buffers: shared {parts}")
+
+        for child in node["children"]:
+            render(child, depth + 1, shift)
+
+    render(plan["root"], 0)
+    if plan["planning_ms"] is not None:
+        lines.append(f"Planning Time: {plan['planning_ms']:.3f} ms")
+    if plan["execution_ms"] is not None:
+        lines.append(f"Execution Time: {plan['execution_ms']:.3f} ms")
+    return "\n".join(lines)
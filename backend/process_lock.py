@@ -0,0 +1,64 @@
+import asyncio
+import fcntl
+import os
+from pathlib import Path
+from typing import Optional
+from database import DB_PATH
+
+LOCK_DIR = Path(os.getenv("LOCK_PATH", DB_PATH.parent))
+LOCK_POLL_SECONDS = 0.05
+
+WORKER_COUNT = int(os.getenv("WEB_CONCURRENCY", "1"))
+SHARED_STATE = os.getenv("SHARED_STATE", "true" if WORKER_COUNT > 1 else "false").lower() == "true"
+
+
+def _lock_path(name: str) -> Path:
+    safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in name)
+    return LOCK_DIR / f"{safe_name}.lock"
+
+
+class FileLock:
+    # flock-based lock shared by every worker process on the host. Acquisition
+    # polls with LOCK_NB so waiting never blocks the event loop and stays
+    # cancellable.
+    def __init__(self, name: str):
+        self.path = _lock_path(name)
+        self._fd: Optional[int] = None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+
+        LOCK_DIR.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+
+        self._fd = fd
+        return True
+
+    async def acquire(self) -> None:
+        while not self.try_acquire():
+            await asyncio.sleep(LOCK_POLL_SECONDS)
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
@@ -0,0 +1,95 @@
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import Response
+from query_fingerprint import fingerprint_query
+from serialization import dumps
+from static_assets import StaticAssetIndex, encoded_variants, negotiated_response, strong_etag
+
+CATALOG_CACHE_CONTROL = "public, no-cache"
+
+
+@dataclass
+class CatalogQuery:
+    id: int
+    filename: str
+    text: str
+    fingerprint: str
+    request_id: str
+
+
+class QueryCatalog:
+    # Built from the resources index, so it reloads whenever that index does.
+    # The encoded bundle only depends on which queries have cached results, so
+    # it is rebuilt when that set changes rather than on every request.
+    def __init__(self, resources: StaticAssetIndex):
+        self.resources = resources
+        self.queries: List[CatalogQuery] = []
+        self._source: Optional[Dict] = None
+        self._bundle_key: Optional[FrozenSet[str]] = None
+        self._bundle: Optional[Tuple[str, Dict[str, bytes]]] = None
+
+    def _load(self) -> None:
+        if self._source is self.resources.assets:
+            return
+
+        queries = []
+        for name, asset in self.resources.assets.items():
+            stem, _, suffix = name.partition(".")
+            if suffix != "sql" or not stem.isdigit():
+                continue
+
+            text = asset.variants["identity"].decode()
+            queries.append(CatalogQuery(
+                id=int(stem),
+                filename=name,
+                text=text,
+                fingerprint=fingerprint_query(text),
+                # Matches the /query result cache key
+                request_id=hashlib.md5(text.encode()).hexdigest()
+            ))
+
+        self.queries = sorted(queries, key=lambda query: query.id)
+        self._source = self.resources.assets
+        self._bundle_key = None
+        self._bundle = None
+
+    def request_ids(self) -> List[str]:
+        self._load()
+        return [query.request_id for query in self.queries]
+
+    def get(self, query_id: int) -> Optional[CatalogQuery]:
+        self._load()
+        for query in self.queries:
+            if query.id == query_id:
+                return query
+        return None
+
+    async def _render(self, cached_ids: FrozenSet[str]) -> Tuple[str, Dict[str, bytes]]:
+        if self._bundle is not None and self._bundle_key == cached_ids:
+            return self._bundle
+
+        body = dumps({
+            "queries": [
+                {
+                    "id": query.id,
+                    "filename": query.filename,
+                    "text": query.text,
+                    "fingerprint": query.fingerprint,
+                    "cached": query.request_id in cached_ids
+                }
+                for query in self.queries
+            ]
+        })
+        # Re-rendered after every newly cached query; brotli at quality 11
+        # takes long enough that it must stay off the event loop
+        self._bundle = (strong_etag(body), await asyncio.to_thread(encoded_variants, body))
+        self._bundle_key = cached_ids
+        return self._bundle
+
+    async def respond(self, request: Request, cached_ids: FrozenSet[str]) -> Response:
+        self._load()
+        etag, variants = await self._render(cached_ids)
+        return negotiated_response(request, variants, etag, "application/json", CATALOG_CACHE_CONTROL)
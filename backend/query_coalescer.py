@@ -0,0 +1,88 @@
+import asyncio
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from database import claim_inflight_query, is_query_inflight, release_inflight_query
+from logger import logger
+
+COALESCE_POLL_SECONDS = 0.25
+
+
+class QueryCoalescer:
+    # Identical uncached queries share one execution. Within a process waiters
+    # attach to the running future; with shared state, a claim row in SQLite
+    # makes other workers wait for the result cache instead of re-running.
+    def __init__(self, shared: bool, claim_ttl_seconds: float):
+        self.shared = shared
+        self.claim_ttl_seconds = claim_ttl_seconds
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def inflight_count(self) -> int:
+        # Distinct queries this worker is executing right now
+        return len(self._inflight)
+
+    async def _wait_for_other_worker(
+        self,
+        request_id: str,
+        load_cached: Callable[[], Awaitable[Optional[Any]]]
+    ) -> Optional[Any]:
+        while True:
+            cached = await load_cached()
+            if cached is not None:
+                return cached
+            if not await is_query_inflight(request_id):
+                # The owner finished without caching (error) or died; check
+                # once more for a result written just before the release
+                return await load_cached()
+            await asyncio.sleep(COALESCE_POLL_SECONDS)
+
+    async def run(
+        self,
+        request_id: str,
+        execute: Callable[[], Awaitable[Any]],
+        load_cached: Callable[[], Awaitable[Optional[Any]]]
+    ) -> Tuple[Any, bool]:
+        while request_id in self._inflight:
+            existing = self._inflight[request_id]
+            logger.info("Coalescing request_id: %s onto in-flight execution", request_id)
+            try:
+                return await asyncio.shield(existing), True
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling() or not existing.cancelled():
+                    raise
+                # The owning request was cancelled (client went away), so this
+                # waiter takes over the execution
+                await asyncio.sleep(0)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[request_id] = future
+        claimed = False
+
+        try:
+            if self.shared:
+                while not await claim_inflight_query(request_id, self.owner, self.claim_ttl_seconds):
+                    logger.info("Waiting on another worker for request_id: %s", request_id)
+                    cached = await self._wait_for_other_worker(request_id, load_cached)
+                    if cached is not None:
+                        future.set_result(cached)
+                        return cached, True
+                claimed = True
+
+            result = await execute()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            if not future.done():
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    # Mark retrieved so an unawaited future does not log a warning
+                    future.exception()
+            raise
+        finally:
+            self._inflight.pop(request_id, None)
+            if claimed:
+                await release_inflight_query(request_id, self.owner)
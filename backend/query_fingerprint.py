@@ -0,0 +1,46 @@
+import hashlib
+import re
+
+_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<string>'(?:[^']|'')*')
+    | (?P<ident>"(?:[^"]|"")*")
+    | (?P<line_comment>--[^\n]*)
+    | (?P<block_comment>/\*.*?\*/)
+    | (?P<space>\s+)
+    | (?P<other>[^'"\s/-]+|.)
+    """,
+    re.VERBOSE | re.DOTALL
+)
+
+
+def normalize_query(query: str) -> str:
+    parts = []
+    pending_space = False
+
+    for match in _TOKEN_PATTERN.finditer(query.strip()):
+        kind = match.lastgroup
+        token = match.group()
+
+        if kind in ("line_comment", "block_comment", "space"):
+            pending_space = True
+            continue
+
+        if pending_space and parts:
+            parts.append(" ")
+        pending_space = False
+
+        if kind in ("string", "ident"):
+            parts.append(token)
+        else:
+            parts.append(token.lower())
+
+    normalized = "".join(parts).rstrip()
+    while normalized.endswith(";"):
+        normalized = normalized[:-1].rstrip()
+
+    return normalized
+
+
+def fingerprint_query(query: str) -> str:
+    return hashlib.sha256(normalize_query(query).encode()).hexdigest()
@@ -0,0 +1,177 @@
+import asyncio
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from logger import logger
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "600"))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+class JobQueueFullError(RuntimeError):
+    pass
+
+
+@dataclass
+class QueryJob:
+    id: str
+    query: str
+    status: str = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    coalesced: bool = False
+    error: Optional[str] = None
+    timings: Optional[Dict[str, float]] = None
+    # Replaced on every status change; subscribers wait on the current one
+    changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def set_status(self, status: str) -> None:
+        self.status = status
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "coalesced": self.coalesced,
+            "error": self.error,
+            "timings": self.timings,
+        }
+
+
+# Uncached queries submitted as jobs run on a fixed number of worker tasks fed
+# from a bounded queue, so the HTTP request returns immediately. The job id is
+# the query's request_id: resubmitting a running query returns the same job, and
+# results are read back from the query cache rather than held here, so any
+# worker process can serve a finished job.
+class QueryJobManager:
+    def __init__(
+        self,
+        execute: Callable[[QueryJob], Awaitable[bool]],
+        workers: int = JOB_WORKERS,
+        queue_size: int = JOB_QUEUE_SIZE,
+        retention_seconds: float = JOB_RETENTION_SECONDS
+    ):
+        self.execute = execute
+        self.worker_count = workers
+        self.retention_seconds = retention_seconds
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.jobs: Dict[str, QueryJob] = {}
+        self._workers: List[asyncio.Task] = []
+        self.counters = {
+            "submitted": 0,
+            "deduplicated": 0,
+            "rejected": 0,
+            "done": 0,
+            "failed": 0,
+        }
+
+    def start(self) -> None:
+        self._workers = [t for t in self._workers if not t.done()]
+        while len(self._workers) < self.worker_count:
+            self._workers.append(asyncio.create_task(self._run()))
+
+    def get(self, job_id: str) -> Optional[QueryJob]:
+        self.prune()
+        return self.jobs.get(job_id)
+
+    def submit(self, job_id: str, query: str) -> QueryJob:
+        self.prune()
+
+        existing = self.jobs.get(job_id)
+        if existing is not None and existing.status in ACTIVE_STATUSES:
+            self.counters["deduplicated"] += 1
+            return existing
+
+        if self.queue.full():
+            self.counters["rejected"] += 1
+            raise JobQueueFullError(f"Job queue is full ({self.queue.maxsize} jobs waiting)")
+
+        job = QueryJob(id=job_id, query=query)
+        self.jobs[job_id] = job
+        self.queue.put_nowait(job)
+        self.counters["submitted"] += 1
+        logger.info("Queued job %s (%s waiting)", job_id, self.queue.qsize())
+        return job
+
+    def prune(self) -> int:
+        cutoff = time.time() - self.retention_seconds
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+        return len(expired)
+
+    async def _run(self) -> None:
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run_job(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run_job(self, job: QueryJob) -> None:
+        job.started_at = time.time()
+        job.set_status("running")
+
+        try:
+            job.coalesced = await self.execute(job)
+        except asyncio.CancelledError:
+            job.error = "Job cancelled"
+            job.finished_at = time.time()
+            job.set_status("failed")
+            raise
+        except Exception as e:
+            logger.error("Job %s failed: %s", job.id, e)
+            job.error = str(e)
+            job.finished_at = time.time()
+            self.counters["failed"] += 1
+            job.set_status("failed")
+            return
+
+        job.finished_at = time.time()
+        self.counters["done"] += 1
+        logger.info("Job %s finished in %.2fs", job.id, job.finished_at - job.started_at)
+        job.set_status("done")
+
+    async def wait_for_change(self, job: QueryJob, status: str, timeout: float) -> bool:
+        if job.status != status:
+            return True
+        try:
+            await asyncio.wait_for(job.changed.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            **self.counters,
+            "workers": len([t for t in self._workers if not t.done()]),
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "jobs": statuses,
+        }
+
+    async def close(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        for task in self._workers:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
@@ -0,0 +1,283 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+import aiosqlite
+from database import DB_PATH
+from logger import logger
+
+RATE_LIMIT_SYNC_SECONDS = float(os.getenv("RATE_LIMIT_SYNC_SECONDS", "1"))
+
+
+class _WindowState:
+    __slots__ = ("window_start", "previous", "current", "last_seen")
+
+    def __init__(self, window_start: float):
+        self.window_start = window_start
+        self.previous = 0
+        self.current = 0
+        self.last_seen = window_start
+
+
+# Sliding-window counter: the previous fixed window is weighted by how much of
+# it still overlaps the sliding window. Keys are kept least-recently-seen first
+# so idle keys are evicted from the front, and max_keys bounds memory.
+class SlidingWindowRateLimiter:
+    def __init__(self, limit: int, window_seconds: float = 60.0, max_keys: int = 100_000):
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._states: "OrderedDict[str, _WindowState]" = OrderedDict()
+        self.allowed_total = 0
+        self.rejected_total = 0
+        self.evicted_total = 0
+
+    def _roll(self, state: _WindowState, now: float) -> None:
+        elapsed_windows = int((now - state.window_start) // self.window_seconds)
+        if elapsed_windows <= 0:
+            return
+
+        state.previous = state.current if elapsed_windows == 1 else 0
+        state.current = 0
+        state.window_start += elapsed_windows * self.window_seconds
+
+    def _estimate(self, state: _WindowState, now: float) -> float:
+        overlap = 1.0 - (now - state.window_start) / self.window_seconds
+        return state.previous * overlap + state.current
+
+    def allow(self, key: str, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+
+        state = self._states.get(key)
+        if state is None:
+            state = _WindowState(now)
+            self._states[key] = state
+            if len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+                self.evicted_total += 1
+        else:
+            self._states.move_to_end(key)
+
+        self._roll(state, now)
+        state.last_seen = now
+
+        if self._estimate(state, now) >= self.limit:
+            self.rejected_total += 1
+            return False
+
+        state.current += 1
+        self.allowed_total += 1
+        return True
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        # A key idle for two windows has no influence on any future estimate
+        now = time.monotonic() if now is None else now
+        cutoff = now - 2 * self.window_seconds
+
+        evicted = 0
+        while self._states:
+            key, state = next(iter(self._states.items()))
+            if state.last_seen > cutoff:
+                break
+            self._states.popitem(last=False)
+            evicted += 1
+
+        self.evicted_total += evicted
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "limit": self.limit,
+            "tracked_keys": len(self._states),
+            "max_keys": self.max_keys,
+            "allowed_total": self.allowed_total,
+            "rejected_total": self.rejected_total,
+            "evicted_total": self.evicted_total,
+        }
+
+    async def check(self, key: str) -> bool:
+        return self.allow(key)
+
+    async def evict(self) -> int:
+        return self.evict_idle()
+
+    async def snapshot(self) -> Dict[str, int]:
+        return self.stats()
+
+    async def close(self) -> None:
+        pass
+
+
+# Same algorithm with counts shared through SQLite, so every worker process
+# sees the same limits. Windows are aligned to wall-clock multiples of the
+# window length, so workers agree on them without coordinating. A check is
+# decided locally from the counts read at the last sync plus this worker's
+# unsynced requests; a sync every sync_seconds adds those in one write
+# transaction and reads the totals back. Counts only grow within a window, so
+# a stale view can only under-count: each worker may overshoot a limit by what
+# it allows in one sync interval. Counters other than tracked_keys are per
+# process.
+class SharedSlidingWindowRateLimiter(SlidingWindowRateLimiter):
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        window_seconds: float = 60.0,
+        max_keys: int = 100_000,
+        sync_seconds: float = RATE_LIMIT_SYNC_SECONDS
+    ):
+        super().__init__(limit, window_seconds, max_keys)
+        self.name = name
+        self.sync_seconds = sync_seconds
+        # key -> (window index, previous, current) as of the last sync
+        self._shared: Dict[str, Tuple[int, int, int]] = {}
+        # (key, window index) -> requests allowed here and not yet synced
+        self._pending: Dict[Tuple[str, int], int] = {}
+        # Pending counts being written by a sync that hasn't finished
+        self._syncing: Dict[Tuple[str, int], int] = {}
+        self._touched: Set[str] = set()
+        self._sync_task: Optional[asyncio.Task] = None
+
+    def _scoped(self, key: str) -> str:
+        return f"{self.name}:{key}"
+
+    def _rolled(self, row, window: int) -> Tuple[int, int]:
+        # (previous, current) of a stored row as seen from window
+        if row is None:
+            return 0, 0
+        index, previous, current = int(row[0] // self.window_seconds), row[1], row[2]
+        if index == window:
+            return previous, current
+        if index == window - 1:
+            return current, 0
+        return 0, 0
+
+    def _count(self, key: str, window: int) -> int:
+        count = self._pending.get((key, window), 0) + self._syncing.get((key, window), 0)
+        shared = self._shared.get(key)
+        if shared is not None:
+            index, previous, current = shared
+            if window == index:
+                count += current
+            elif window == index - 1:
+                count += previous
+        return count
+
+    async def _load(self, key: str, window: int) -> None:
+        # First sight of a key in this worker: a plain read, which WAL lets
+        # run alongside other workers' writes
+        async with aiosqlite.connect(DB_PATH) as db:
+            async with db.execute(
+                "SELECT window_start, previous, current FROM rate_limits WHERE key = ?",
+                (self._scoped(key),)
+            ) as cursor:
+                row = await cursor.fetchone()
+        self._shared[key] = (window, *self._rolled(row, window))
+
+    async def check(self, key: str) -> bool:
+        now = time.time()
+        window = int(now // self.window_seconds)
+        if key not in self._shared:
+            await self._load(key, window)
+        self._touched.add(key)
+
+        overlap = 1.0 - (now - window * self.window_seconds) / self.window_seconds
+        if self._count(key, window - 1) * overlap + self._count(key, window) >= self.limit:
+            self.rejected_total += 1
+            return False
+
+        self._pending[(key, window)] = self._pending.get((key, window), 0) + 1
+        self.allowed_total += 1
+        if self._sync_task is None or self._sync_task.done():
+            self._sync_task = asyncio.create_task(self._sync_later())
+        return True
+
+    async def _sync_later(self) -> None:
+        await asyncio.sleep(self.sync_seconds)
+        try:
+            await self.sync()
+        except Exception as e:
+            logger.warning("Failed to sync %s rate limits: %s", self.name, e)
+
+    async def sync(self) -> None:
+        pending, self._pending = self._pending, {}
+        self._syncing = pending
+        keys, self._touched = self._touched | {key for key, _ in pending}, set()
+        if not keys:
+            return
+
+        now = time.time()
+        window = int(now // self.window_seconds)
+        shared = {}
+        try:
+            async with aiosqlite.connect(DB_PATH) as db:
+                await db.execute("BEGIN IMMEDIATE")
+                for key in keys:
+                    async with db.execute(
+                        "SELECT window_start, previous, current FROM rate_limits WHERE key = ?",
+                        (self._scoped(key),)
+                    ) as cursor:
+                        previous, current = self._rolled(await cursor.fetchone(), window)
+
+                    added_previous = pending.get((key, window - 1), 0)
+                    added_current = pending.get((key, window), 0)
+                    if added_previous or added_current:
+                        previous += added_previous
+                        current += added_current
+                        await db.execute(
+                            "INSERT OR REPLACE INTO rate_limits (key, window_start, previous, current, last_seen) "
+                            "VALUES (?, ?, ?, ?, ?)",
+                            (self._scoped(key), window * self.window_seconds, previous, current, now)
+                        )
+                    shared[key] = (window, previous, current)
+                await db.commit()
+        except Exception:
+            for item, count in pending.items():
+                self._pending[item] = self._pending.get(item, 0) + count
+            self._touched |= keys
+            raise
+        finally:
+            self._syncing = {}
+
+        self._shared.update(shared)
+        # Views two windows old no longer affect any estimate
+        for key in [key for key, (index, _, _) in self._shared.items() if index < window - 1]:
+            del self._shared[key]
+
+    async def close(self) -> None:
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            self._sync_task = None
+        await self.sync()
+
+    async def evict(self) -> int:
+        now = time.time()
+        async with aiosqlite.connect(DB_PATH) as db:
+            cursor = await db.execute(
+                "DELETE FROM rate_limits WHERE key LIKE ? AND last_seen <= ?",
+                (f"{self.name}:%", now - 2 * self.window_seconds)
+            )
+            evicted = cursor.rowcount
+            cursor = await db.execute("""
+                DELETE FROM rate_limits WHERE key IN (
+                    SELECT key FROM rate_limits WHERE key LIKE ?
+                    ORDER BY last_seen DESC LIMIT -1 OFFSET ?
+                )
+            """, (f"{self.name}:%", self.max_keys))
+            evicted += cursor.rowcount
+            await db.commit()
+
+        self.evicted_total += evicted
+        return evicted
+
+    async def snapshot(self) -> Dict[str, int]:
+        async with aiosqlite.connect(DB_PATH) as db:
+            async with db.execute(
+                "SELECT COUNT(*) FROM rate_limits WHERE key LIKE ?", (f"{self.name}:%",)
+            ) as cursor:
+                tracked = (await cursor.fetchone())[0]
+
+        stats = self.stats()
+        stats["tracked_keys"] = tracked
+        return stats
@@ -0,0 +1,65 @@
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+# Server-Timing metric names must be HTTP tokens
+_INVALID_NAME_CHARS = re.compile(r"[^A-Za-z0-9!#$%&'*+.^_`|~-]")
+
+
+class RequestTimings:
+    # Per-request breakdown in milliseconds. Repeated phases (retries, several
+    # statements) accumulate into the same entry.
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.entries: Dict[str, float] = {}
+
+    def add(self, name: str, elapsed_ms: float) -> None:
+        self.entries[name] = self.entries.get(name, 0.0) + elapsed_ms
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def as_dict(self) -> Dict[str, float]:
+        timings = {name: round(elapsed_ms, 2) for name, elapsed_ms in self.entries.items()}
+        timings["total"] = round(self.total_ms(), 2)
+        return timings
+
+    def server_timing(self, values: Optional[Dict[str, float]] = None) -> str:
+        values = self.as_dict() if values is None else values
+        return ", ".join(
+            f"{_INVALID_NAME_CHARS.sub('_', name)};dur={elapsed_ms}"
+            for name, elapsed_ms in values.items()
+        )
+
+
+# Tasks started with gather/create_task copy the context, so connectors running
+# concurrently for one request all record into the same RequestTimings
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def start_request_timings() -> RequestTimings:
+    timings = RequestTimings()
+    _current.set(timings)
+    return timings
+
+
+def current_timings() -> Optional[Dict[str, float]]:
+    timings = _current.get()
+    return timings.as_dict() if timings is not None else None
+
+
+def record_timing(name: str, elapsed_ms: float) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, elapsed_ms)
+
+
+@contextmanager
+def measure(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_timing(name, (time.perf_counter() - start) * 1000)
@@ -0,0 +1,51 @@
+from typing import Any, Dict, Optional, Union
+import orjson
+from fastapi.responses import Response
+from request_timings import RequestTimings
+
+JSON_MEDIA_TYPE = "application/json"
+
+
+def dumps(obj: Any) -> bytes:
+    # orjson handles dataclasses and datetimes natively, so response dicts
+    # skip FastAPI's jsonable_encoder pass entirely
+    return orjson.dumps(obj)
+
+
+def as_bytes(raw: Union[bytes, str]) -> bytes:
+    return raw if isinstance(raw, bytes) else raw.encode()
+
+
+def json_response(obj: Any, status_code: int = 200, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(content=dumps(obj), status_code=status_code, media_type=JSON_MEDIA_TYPE, headers=headers)
+
+
+def raw_json_response(
+    body: Union[bytes, str],
+    status_code: int = 200,
+    headers: Optional[Dict[str, str]] = None
+) -> Response:
+    return Response(content=as_bytes(body), status_code=status_code, media_type=JSON_MEDIA_TYPE, headers=headers)
+
+
+def splice_result(fields: Dict[str, Any], result_json: Union[bytes, str]) -> bytes:
+    # The result is spliced in already encoded, so a cached or freshly cached
+    # result is never decoded and re-encoded
+    head = dumps(fields)[:-1]
+    separator = b"," if len(head) > 1 else b""
+    return head + separator + b'"result":' + as_bytes(result_json) + b"}"
+
+
+def query_response(cached: bool, result_json: Union[bytes, str], timings: Optional[RequestTimings] = None) -> Response:
+    # Timings belong to this request, not the cached result, so they sit beside it
+    fields: Dict[str, Any] = {"cached": cached}
+    headers = None
+    if timings is not None:
+        fields["timings"] = timings.as_dict()
+        headers = {"Server-Timing": timings.server_timing(fields["timings"])}
+    return raw_json_response(splice_result(fields, result_json), headers=headers)
+
+
+def sse_event(event: str, data: bytes) -> bytes:
+    # orjson output never contains newlines, so one data line is enough
+    return b"event: " + event.encode() + b"\ndata: " + data + b"\n\n"
@@ -0,0 +1,60 @@
+import os
+from typing import Any, Dict, List, Optional
+from database import log_slow_query
+from logger import logger
+from query_fingerprint import fingerprint_query
+from request_timings import current_timings
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "5000"))
+SLOW_QUERY_THRESHOLDS_MS = {
+    "postgres": float(os.getenv("POSTGRES_SLOW_QUERY_MS", SLOW_QUERY_THRESHOLD_MS)),
+    "pgx-lower": float(os.getenv("PGX_LOWER_SLOW_QUERY_MS", SLOW_QUERY_THRESHOLD_MS)),
+}
+
+
+def is_slow(engine: str, elapsed_ms: float) -> bool:
+    threshold = SLOW_QUERY_THRESHOLDS_MS.get(engine, SLOW_QUERY_THRESHOLD_MS)
+    return threshold > 0 and elapsed_ms >= threshold
+
+
+def ir_stage_sizes(ir_stages: List[Dict[str, Any]]) -> Dict[str, int]:
+    return {stage["stage"]: len(stage.get("content") or "") for stage in ir_stages}
+
+
+async def record_slow_query(
+    engine: str,
+    query: str,
+    elapsed_ms: float,
+    load: Dict[str, Any],
+    latency_ms: Optional[float] = None,
+    row_count: Optional[int] = None,
+    plan: Optional[Dict[str, Any]] = None,
+    breakdown: Optional[Dict[str, Any]] = None,
+    ir_stages: Optional[List[Dict[str, Any]]] = None,
+    error: Optional[str] = None
+) -> None:
+    # elapsed_ms is wall time for the engine including lock waits and
+    # connects; latency_ms is what the engine itself reported
+    fingerprint = fingerprint_query(query)
+    logger.warning(
+        f"Slow {engine} query {fingerprint[:16]}: {elapsed_ms:.0f} ms"
+        + (f" (failed: {error})" if error else "")
+    )
+
+    try:
+        await log_slow_query({
+            "fingerprint": fingerprint,
+            "query_text": query,
+            "database": engine,
+            "elapsed_ms": round(elapsed_ms, 2),
+            "latency_ms": latency_ms,
+            "row_count": row_count,
+            "error": error,
+            "timings": current_timings(),
+            "breakdown": breakdown,
+            "plan": plan,
+            "ir_stage_sizes": ir_stage_sizes(ir_stages) if ir_stages else None,
+            "load": load,
+        })
+    except Exception as e:
+        logger.error("Failed to record slow query %s: %s", fingerprint[:16], e)
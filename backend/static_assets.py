@@ -0,0 +1,233 @@
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+from dataclasses import dataclass, field
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+import brotli
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+from logger import logger
+
+TEXT_SUFFIXES = {".md", ".sql", ".svg", ".txt", ".json"}
+IMMUTABLE_SUFFIXES = {".pdf", ".png", ".jpg", ".jpeg", ".gif"}
+MEDIA_TYPES = {
+    ".md": "text/markdown; charset=utf-8",
+    ".sql": "text/plain; charset=utf-8",
+    ".txt": "text/plain; charset=utf-8",
+}
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+CHANGE_CHECK_INTERVAL_SECONDS = 5.0
+
+
+@dataclass
+class StaticAsset:
+    name: str
+    path: Path
+    size: int
+    mtime: float
+    etag: str
+    media_type: str
+    cache_control: str
+    # Encoded bodies for text assets, keyed by content-coding ("identity" included)
+    variants: Dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def last_modified(self) -> str:
+        return formatdate(self.mtime, usegmt=True)
+
+
+def encoded_variants(data: bytes) -> Dict[str, bytes]:
+    return {
+        "identity": data,
+        "br": brotli.compress(data, quality=11),
+        "gzip": gzip.compress(data, compresslevel=9, mtime=0),
+    }
+
+
+def strong_etag(data: bytes) -> str:
+    return f'"{hashlib.sha256(data).hexdigest()[:32]}"'
+
+
+def coded_etag(etag: str, coding: str) -> str:
+    # Each content-coding is a different representation, so it needs its own
+    # strong validator (RFC 9110 8.8.3)
+    return etag if coding == "identity" else f'{etag[:-1]}-{coding}"'
+
+
+def _build_asset(entry: os.DirEntry, stat: os.stat_result) -> StaticAsset:
+    suffix = Path(entry.name).suffix.lower()
+    data = Path(entry.path).read_bytes()
+
+    variants = encoded_variants(data) if suffix in TEXT_SUFFIXES else {}
+
+    media_type = MEDIA_TYPES.get(suffix) or mimetypes.guess_type(entry.name)[0] or "application/octet-stream"
+
+    return StaticAsset(
+        name=entry.name,
+        path=Path(entry.path),
+        size=stat.st_size,
+        mtime=stat.st_mtime,
+        etag=strong_etag(data),
+        media_type=media_type,
+        cache_control=IMMUTABLE_CACHE_CONTROL if suffix in IMMUTABLE_SUFFIXES else REVALIDATE_CACHE_CONTROL,
+        variants=variants
+    )
+
+
+def _etag_matches(if_none_match: str, etags: Iterable[str]) -> bool:
+    etags = set(etags)
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in etags:
+            return True
+    return False
+
+
+def _not_modified(request: Request, etags: Iterable[str], mtime: Optional[float] = None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etags)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and mtime is not None:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+
+    return False
+
+
+def _choose_encoding(variants: Dict[str, bytes], accept_encoding: str) -> str:
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(coding.strip().lower())
+
+    for coding in ("br", "gzip"):
+        if coding in variants and (coding in accepted or "*" in accepted):
+            return coding
+    return "identity"
+
+
+def negotiated_response(
+    request: Request,
+    variants: Dict[str, bytes],
+    etag: str,
+    media_type: str,
+    cache_control: str,
+    mtime: Optional[float] = None
+) -> Response:
+    coding = _choose_encoding(variants, request.headers.get("accept-encoding", ""))
+    headers = {
+        "ETag": coded_etag(etag, coding),
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if mtime is not None:
+        headers["Last-Modified"] = formatdate(mtime, usegmt=True)
+
+    # Any coding's validator means the client holds the current content
+    if _not_modified(request, (coded_etag(etag, variant) for variant in variants), mtime):
+        return Response(status_code=304, headers=headers)
+
+    if coding != "identity":
+        headers["Content-Encoding"] = coding
+
+    return Response(content=variants[coding], media_type=media_type, headers=headers)
+
+
+class StaticAssetIndex:
+    # Indexes a flat directory so requests are served from a dict lookup.
+    # Only indexed names are served, which also rules out path traversal.
+    # Reading and compressing files happens on a thread, at startup and then
+    # every few seconds when a file's mtime or size has changed.
+    def __init__(self, root: Path):
+        self.root = root
+        self.assets: Dict[str, StaticAsset] = {}
+        self._missing = False
+        self._watcher: Optional[asyncio.Task] = None
+
+    def refresh(self) -> bool:
+        try:
+            with os.scandir(self.root) as scan:
+                entries = [entry for entry in scan if not entry.name.startswith(".") and entry.is_file()]
+            self._missing = False
+        except FileNotFoundError:
+            if not self._missing:
+                logger.warning("Static asset directory not found: %s", self.root)
+            self._missing = True
+            entries = []
+
+        # Unchanged files keep their already encoded asset
+        assets = {}
+        changed = len(entries) != len(self.assets)
+        for entry in entries:
+            stat = entry.stat()
+            current = self.assets.get(entry.name)
+            if current is not None and current.mtime == stat.st_mtime and current.size == stat.st_size:
+                assets[entry.name] = current
+            else:
+                assets[entry.name] = _build_asset(entry, stat)
+                changed = True
+
+        if changed:
+            self.assets = assets
+            logger.info("Indexed %s static assets in %s", len(assets), self.root)
+        return changed
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self.refresh)
+        if self._watcher is None or self._watcher.done():
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(CHANGE_CHECK_INTERVAL_SECONDS)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.warning("Failed to re-index static assets in %s: %s", self.root, e)
+
+    async def close(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+
+    def get(self, name: str) -> Optional[StaticAsset]:
+        return self.assets.get(name)
+
+    def respond(self, asset: StaticAsset, request: Request, download: bool = False) -> Response:
+        if asset.variants and not download:
+            return negotiated_response(
+                request, asset.variants, asset.etag, asset.media_type, asset.cache_control, asset.mtime
+            )
+
+        headers = {
+            "ETag": asset.etag,
+            "Last-Modified": asset.last_modified,
+            "Cache-Control": asset.cache_control,
+        }
+
+        if _not_modified(request, (asset.etag,), asset.mtime):
+            return Response(status_code=304, headers=headers)
+
+        if download:
+            return FileResponse(asset.path, filename=asset.name, media_type=asset.media_type, headers=headers)
+
+        return FileResponse(asset.path, media_type=asset.media_type, headers=headers)
@@ -24,15 +24,25 @@ interface QueryResult {
   results: DatabaseResult[];
 }
 
+interface CatalogQuery {
+  id: number;
+  filename: string;
+  text: string;
+  fingerprint: string;
+  cached: boolean;
+}
+
 const QueryPage: React.FC = () => {
   const [query, setQuery] = useState<string>('-- Select a TPC-H query or write your own');
   const [result, setResult] = useState<QueryResult | null>(null);
   const [isCached, setIsCached] = useState<boolean>(false);
   const [loading, setLoading] = useState<boolean>(false);
+  const [error, setError] = useState<string | null>(null);
   const [expandedDatabases, setExpandedDatabases] = useState<Set<string>>(new Set());
   const [editorHeight, setEditorHeight] = useState<number>(250);
   const [mainDisplayHeight, setMainDisplayHeight] = useState<number>(100);
   const [outputHeights, setOutputHeights] = useState<{[key: string]: number}>({});
+  const [catalog, setCatalog] = useState<{[id: number]: CatalogQuery} | null>(null);
 
   const calculateHeight = (content: string, lineHeight: number = 20) => {
     const lines = content.split('\n').length;
@@ -65,7 +75,32 @@ const QueryPage: React.FC = () => {
     };
   };
 
+  const loadCatalog = async () => {
+    if (catalog) {
+      return catalog;
+    }
+    const response = await fetch(`${API_BASE_URL}/resources/queries`);
+    if (!response.ok) {
+      throw new Error(`Catalog request failed: ${response.status}`);
+    }
+    const data = await response.json();
+    const byId: {[id: number]: CatalogQuery} = {};
+    data.queries.forEach((q: CatalogQuery) => { byId[q.id] = q; });
+    setCatalog(byId);
+    return byId;
+  };
+
   const loadQuery = async (queryNumber: number) => {
+    try {
+      const queries = await loadCatalog();
+      if (queries[queryNumber]) {
+        setQuery(queries[queryNumber].text);
+        return;
+      }
+    } catch (error) {
+      console.error('Failed to load query catalog:', error);
+    }
+
     try {
       const response = await fetch(`${API_BASE_URL}/resources/${queryNumber}.sql`);
       const sql = await response.text();
@@ -75,19 +110,109 @@ const QueryPage: React.FC = () => {
     }
   };
 
+  const responseError = async (response: Response) => {
+    const data = await response.json().catch(() => null);
+    if (data && data.detail) {
+      const detail = typeof data.detail === 'string' ? data.detail : JSON.stringify(data.detail);
+      return `${response.status}: ${detail}`;
+    }
+    return `Request failed: ${response.status} ${response.statusText}`;
+  };
+
+  const executeQueryBuffered = async () => {
+    const response = await fetch(`${API_BASE_URL}/query`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ query }),
+    });
+    if (!response.ok) {
+      throw new Error(await responseError(response));
+    }
+    const data = await response.json();
+    setResult(data.result);
+    setIsCached(data.cached || false);
+  };
+
+  // Each engine's result is shown as soon as it arrives; "done" replaces the
+  // partial view with the combined result
+  const applyStreamEvent = (event: string, data: any) => {
+    if (event === 'engine') {
+      setResult((prev) => ({
+        main_display: 'Waiting for the remaining database...',
+        results: [...(prev?.results || []).filter((r) => r.database !== data.database), data],
+      }));
+    } else if (event === 'ir_stage') {
+      setResult((prev) => prev && {
+        ...prev,
+        results: prev.results.map((r) =>
+          r.database === data.database ? { ...r, outputs: [...r.outputs, data.output] } : r
+        ),
+      });
+    } else if (event === 'done') {
+      setResult(data.result);
+      setIsCached(data.cached || false);
+    } else if (event === 'error') {
+      throw new Error(data.error);
+    }
+  };
+
+  const readEventStream = async (body: ReadableStream<Uint8Array>) => {
+    const reader = body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) {
+        break;
+      }
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary >= 0) {
+        const message = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        boundary = buffer.indexOf('\n\n');
+
+        let event = 'message';
+        let data = '';
+        message.split('\n').forEach((line) => {
+          if (line.startsWith('event: ')) {
+            event = line.slice(7);
+          } else if (line.startsWith('data: ')) {
+            data += line.slice(6);
+          }
+        });
+        if (data) {
+          applyStreamEvent(event, JSON.parse(data));
+        }
+      }
+    }
+  };
+
   const executeQuery = async () => {
     setLoading(true);
+    setResult(null);
+    setIsCached(false);
+    setError(null);
     try {
-      const response = await fetch(`${API_BASE_URL}/query`, {
+      const response = await fetch(`${API_BASE_URL}/query/stream`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ query }),
       });
-      const data = await response.json();
-      setResult(data.result);
-      setIsCached(data.cached || false);
+      // Only a missing stream endpoint or an unreadable body falls back to
+      // /query; any other error is the real answer and is shown as is
+      if (response.status === 404 || response.status === 405 || (response.ok && !response.body)) {
+        await executeQueryBuffered();
+      } else if (!response.ok) {
+        throw new Error(await responseError(response));
+      } else {
+        await readEventStream(response.body!);
+      }
     } catch (error) {
       console.error('Failed to execute query:', error);
+      setError(error instanceof Error ? error.message : String(error));
     }
     setLoading(false);
   };
@@ -152,6 +277,7 @@ const QueryPage: React.FC = () => {
           </button>
           <span className="resize-hint">Click and drag the bottom of the editor to resize!</span>
         </div>
+        {error && <div className="query-error">{error}</div>}
       </div>
 
       {result && (
@@ -121,7 +121,8 @@ def load_data():
 
     df = extract_metrics(df)
 
-    df = df.dropna(subset=['duration_ms', 'memory_peak_mb'])
+    # Runs recorded by the API's /benchmark endpoint have no memory figures
+    df = df.dropna(subset=['duration_ms'])
 
     df['pgx_label'] = df['pgx_enabled'].map({1: 'pgx-lower', 0: 'PostgreSQL'})
 
@@ -515,7 +516,7 @@ def create_statistics_pdf(benchmark_df, perf_df):
         create_latency_statistics_page(pdf, benchmark_df)
 
         # Page 2: Memory Statistics
-        create_memory_statistics_page(pdf, benchmark_df)
+        create_memory_statistics_page(pdf, benchmark_df.dropna(subset=['memory_peak_mb']))
 
         # Page 3+: Performance Statistics
         create_perf_statistics_page(pdf, perf_df)
@@ -726,11 +727,13 @@ def main():
     print("Generating diff_plots.pdf...")
     create_diff_plot_pdf(df)
 
+    memory_df = df.dropna(subset=['memory_peak_mb'])
+
     print("Generating memory_plots.pdf...")
-    create_memory_plot_pdf(df)
+    create_memory_plot_pdf(memory_df)
 
     print("Generating memory_diffs.pdf...")
-    create_memory_diff_pdf(df)
+    create_memory_diff_pdf(memory_df)
 
     print("\nLoading performance stats data...")
     try: